@@ -5,97 +5,121 @@ Date: 4/14/19
 '''
 
 import numpy as np
-import time
-from math import sqrt,log,floor,fabs
-from sklearn.metrics import roc_auc_score
+from math import sqrt,log,floor,fabs,isfinite
+from jit import arrays, backend, fsauc_steps, indices, segments
+from rows import check, row
+from schedule import Schedule
 
-def proj_sim(v,R):
+def proj_sim(v,R,out=None,tmp=None,mask=None):
     '''
-    projection onto simplex by Duchi et al.
+    projection onto l1 ball by Michelot's filtering as in Condat's method,
+    a few O(d) passes without sorting. Without Condat's online pre-filter,
+    which is sequential, the filtering starts from the bound max|v| - R,
+    in the worst case it takes up to d passes. A non-finite v is returned
+    as it is for the divergence check to see.
     input:
         v -
         R - radius
+        out - array for the result, may be v itself
+        tmp - scratch array of len(v), allocated if not given
+        mask - boolean scratch array of len(v), allocated if not given
     output:
         w -
     '''
 
-    # compute l1 norm
-    norm = np.linalg.norm(v,ord=1)
+    if tmp is None:
+        tmp = np.empty(len(v))
+    if mask is None:
+        mask = np.empty(len(v), dtype=bool)
+
+    u = np.abs(v, out=tmp)
 
-    if norm <= R:
-        w = v
-    else:
-        u = np.sort(np.abs(v))[::-1] # sort in descending order
-        sv = np.cumsum(u) # sum one by one
-        rho = np.nonzero(u * np.arange(1, len(v) + 1) > (sv - R))[0][-1]
-        theta = (sv[rho] - R) / (rho + 1)
-        w = np.sign(v) * np.maximum(np.abs(v) - theta, 0)
+    # compute l1 norm
+    norm = u.sum()
+    if norm <= R or not isfinite(norm):
+        if out is None:
+            return v
+        out[:] = v
+        return out
+
+    # (sum(U) - R) / |U| is below the threshold for any set U, it rises to
+    # it as entries under it are dropped, U is marked in mask rather than
+    # copied out
+    theta = max((norm - R) / len(u), u.max() - R)
+    while True:
+        np.greater(u, theta, out=mask)
+        m = np.count_nonzero(mask)
+        if m == 0:
+            break
+        temp = (np.add.reduce(u, where=mask) - R) / m
+        if temp <= theta:
+            break
+        theta = temp
+
+    # soft threshold in place on the buffer of |v|
+    u -= theta
+    np.maximum(u, 0, out=u)
+    w = np.copysign(u, v, out=out)
 
     return w
 
-def proj_l2(v,o,R):
+def proj_l2(v,o,R,tmp=None):
     '''
     Projection onto eccentric l2 ball
     input:
         v -
         o - center
         R - radius
+        tmp - scratch array, if given v is projected in place
     output:
         w - projected
     '''
 
-    norm = np.linalg.norm(v-o)
-
-    if norm <= R:
-        w = v
-    else:
-        w = v / norm * R + o
+    if tmp is None:
+        norm = np.linalg.norm(v-o)
+        if norm <= R:
+            w = v
+        else:
+            w = (v - o) / norm * R + o
+        return w
 
-    return w
+    np.subtract(v, o, out=tmp)
+    norm = sqrt(tmp @ tmp)
+    if norm > R:
+        tmp *= R / norm
+        np.add(tmp, o, out=v)
 
+    return v
 
-def proj_primal(w,a,b,o,r,R,kappa):
+def proj_primal(v,o,r,R,kappa,tmp,mask):
     '''
-    Alternating Projection Algorithm
+    Alternating Projection Algorithm, in place
     input:
-        v -
-        R - radius
+        v - state w, a, b in one vector
+        o - center
+        r - l2 radius
+        R - l1 radius
+        kappa -
+        tmp - scratch array of the size of v
+        mask - boolean scratch array of the size of w
     output:
-        w -
+        v - projected
     '''
 
-    d = len(w)
+    d = len(v) - 2
+    w = v[:d]
+    ab = v[d:]
 
     # Do it twice!
-    # l1 projection
-    w = proj_sim(w, R)
-    a = np.sign(a) * min(fabs(a), R * kappa)
-    b = np.sign(b) * min(fabs(b), R * kappa)
-
-    # l2 projection
-    v = np.append(w, a)
-    v = np.append(v, b)
-    v = proj_l2(v, o, r)
-
-    w = v[:d] + 0.0
-    a = v[d] + 0.0
-    b = v[d + 1] + 0.0
-
-    # l1 projection
-    w = proj_sim(w, R)
-    a = np.sign(a) * min(fabs(a), R * kappa)
-    b = np.sign(b) * min(fabs(b), R * kappa)
+    for _ in range(2):
+        # l1 projection
+        proj_sim(w, R, out=w, tmp=tmp[:d], mask=mask)
+        np.clip(ab, -R * kappa, R * kappa, out=ab)
 
-    # l2 projection
-    v = np.append(w, a)
-    v = np.append(v, b)
-    v = proj_l2(v, o, r)
+        # l2 projection
+        proj_l2(v, o, r, tmp)
 
-    w = v[:d] + 0.0
-    a = v[d] + 0.0
-    b = v[d + 1] + 0.0
-
-    return w,a,b
+    return v
 
 def proj_dual(alpha,o,D,R,kappa):
     '''
@@ -118,9 +142,9 @@ def FSAUC(Xtr,Xte,Ytr,Yte,options,stamp=10):
     Fast Stochastic AUC Maximization
     input:
         n - total iteration
-        Xtr -
+        Xtr - dense or csr
         Ytr -
-        Xte -
+        Xte - dense or csr
         Yte -
         options -
     output:
@@ -140,6 +164,7 @@ def FSAUC(Xtr,Xte,Ytr,Yte,options,stamp=10):
     kappa = 1
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     N, d = Xtr.shape
 
     # set
@@ -152,102 +177,132 @@ def FSAUC(Xtr,Xte,Ytr,Yte,options,stamp=10):
     beta = (1 + 8 * kappa ** 2)
     D = 2 * sqrt(2) * kappa * r
 
-    # initialize
-    Wt = np.zeros(d)
-    At = 0.0
-    Bt = 0.0
+    # initialize, w, a and b live in one state vector, w is a view of it
+    v = np.zeros(d + 2)
+    wt = v[:d]
+    Vt = np.zeros(d + 2) # center of the stage
+    VT = np.zeros(d + 2) # average of the stage
+    WT = VT[:d]
+    tmp = np.zeros(d + 2)
+    mask = np.zeros(d, dtype=bool)
     ALPHAt = 0.0
 
-    # record auc
-    roc_auc = []
-
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-
-    for k in range(m):
-
-        # initialize counts
-        Ap = np.zeros(d)  # just d dim as last two dim is always zero
-        Am = np.zeros(d)
-        Tp = 0
-        Tm = 0
-        pt = 0
-
-        wt = Wt + 0.0
-        at = At + 0.0
-        bt = Bt + 0.0
-        alphat = ALPHAt + 0.0
-
-        Vt = np.append(Wt, At)
-        Vt = np.append(Vt, Bt)
-
-        WT = wt + 0.0
-        AT = at + 0.0
-        BT = bt + 0.0
+    # same iterations, compiled between evaluations
+    compiled = backend(options, Xtr) == 'numba'
+    if compiled:
+        csr = arrays(Xtr)
+        y = np.asarray(Ytr, dtype=float)
+        idx = indices(N, m * n0)
+        u = np.zeros(d)
+        fsauc_steps(*csr, y, idx[:0], 1, 0.0, float(r), float(R), float(kappa), float(D), ALPHAt,
+                    v, Vt, VT, np.zeros(d), np.zeros(d), tmp, u, np.zeros(4)) # compile off the clock
+
+    # evaluation schedule and records
+    schedule = Schedule(Xte, Yte, options, m * n0, stamp)
+
+    # resume from a paused run at iteration t0 of its stage, a run paused at
+    # the end of a stage resumes with the update of that stage
+    k0, t0 = 0, 1
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        v[:], Vt[:], VT[:] = checkpoint['v'], checkpoint['Vt'], checkpoint['VT']
+        Ap, Am, Tp, Tm, pt, alphat, ALPHAt, r, D, beta = (checkpoint[key] for key in
+            ('Ap', 'Am', 'Tp', 'Tm', 'pt', 'alphat', 'ALPHAt', 'r', 'D', 'beta'))
+        schedule.restore(checkpoint['schedule'])
+        k0 = (schedule.t - 1) // n0
+        t0 = schedule.t - k0 * n0 + 1
+
+    for k in range(k0, m):
+
+        if t0 == 1:
+            # initialize counts
+            Ap = np.zeros(d)  # just d dim as last two dim is always zero
+            Am = np.zeros(d)
+            Tp = 0
+            Tm = 0
+            pt = 0
+
+            # start from the previous average
+            v[:] = VT
+            Vt[:] = VT
+            alphat = ALPHAt + 0.0
 
         # step size
         eta = sqrt(beta) / (sqrt(3 * n0) * G) * r
 
         # Primal Dual Stochastic Gradient(PDSG)
-        for t in range(1,n0+1):
-
-            # compute inner product
-            prod = np.inner(wt, Xtr[(k*n0+t)%N])
-
-            if Ytr[(k*n0+t)%N] == 1:
-                Ap += Xtr[(k*n0+t)%N]
-                Tp += 1
-                pt = Tp / (Tp+Tm)
-
-                # compute gradient
-                gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt) # no xt yet!
-                gradat = 2 * (1 - pt) * (at - prod)
-                gradbt = 0.0
-                gradalphat = -2 * (1 - pt) * prod - 2 * pt * (1-pt) * alphat
-
-            else:
-                Am += Xtr[(k * n0 + t) % N]
-                Tm += 1
-                pt = Tp / (Tp + Tm)
-
-                # compute gradient
-                Ap += Xtr[(k * n0 + t) % N]
-                Tp += 1
-                pt = Tp / (Tp + Tm)
-
-                # compute gradient
-                gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt # no xt yet!
-                gradat = 0.0
-                gradbt = 2 * pt * (bt - prod)
-                gradalphat = 2 * pt * prod - 2 * pt * (1-pt) * alphat
-
-            # update variable
-            wt = wt - eta * gradwt * Xtr[(k*n0+t)%N]
-            at = at - eta * gradat
-            bt = bt - eta * gradbt
-            alphat = alphat + eta * gradalphat
-
-            # projection
-            wt, at, bt = proj_primal(wt, at, bt, Vt, r, R, kappa)
-            alphat = proj_dual(alphat, ALPHAt, D, R, kappa)
-
-            WT = (t*WT + wt) / (t+1)
-            AT = (t * AT + at) / (t + 1)
-            BT = (t * BT + bt) / (t + 1)
-
-            # write results
-            elapsed_time.append(time.time() - start_time)
-            roc_auc.append(roc_auc_score(Yte, np.dot(Xte, WT)))
-
-            # running log
-            if (k * n0 + t) % stamp == 0:
-                print('iteration: %d AUC: %.6f time eplapsed: %.2f' % (k * n0 + t, roc_auc[-1], elapsed_time[-1]))
+        if compiled:
+            state = np.array([Tp, Tm, pt, alphat], dtype=float)
+            for start, stop in segments(schedule, k * n0 + t0, (k + 1) * n0):
+                fsauc_steps(*csr, y, idx[start-1:stop], start - k * n0, eta, float(r), float(R), float(kappa),
+                            float(D), float(ALPHAt), v, Vt, VT, Ap, Am, tmp, u, state)
+                if schedule.due(stop):
+                    schedule.record(stop, WT)
+                    if schedule.stopped:
+                        break
+            Tp, Tm, pt, alphat = state
+        else:
+            for t in range(t0,n0+1):
+
+                # compute inner product
+                ind, xt = row(Xtr, (k*n0+t)%N)
+                prod = np.inner(wt[ind], xt)
+                at = v[d]
+                bt = v[d + 1]
+
+                if Ytr[(k*n0+t)%N] == 1:
+                    Ap[ind] += xt
+                    Tp += 1
+                    pt = Tp / (Tp+Tm)
+
+                    # compute gradient
+                    gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt) # no xt yet!
+                    gradat = 2 * (1 - pt) * (at - prod)
+                    gradbt = 0.0
+                    gradalphat = -2 * (1 - pt) * prod - 2 * pt * (1-pt) * alphat
+
+                else:
+                    Am[ind] += xt
+                    Tm += 1
+                    pt = Tp / (Tp + Tm)
+
+                    # compute gradient
+                    Ap[ind] += xt
+                    Tp += 1
+                    pt = Tp / (Tp + Tm)
+
+                    # compute gradient
+                    gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt # no xt yet!
+                    gradat = 0.0
+                    gradbt = 2 * pt * (bt - prod)
+                    gradalphat = 2 * pt * prod - 2 * pt * (1-pt) * alphat
+
+                # update variable
+                wt[ind] -= eta * gradwt * xt
+                v[d] = at - eta * gradat
+                v[d + 1] = bt - eta * gradbt
+                alphat = alphat + eta * gradalphat
+
+                # projection
+                proj_primal(v, Vt, r, R, kappa, tmp, mask)
+                alphat = proj_dual(alphat, ALPHAt, D, R, kappa)
+
+                # running average of w, a and b in place
+                VT *= t
+                VT += v
+                VT /= t + 1
+
+                # write results
+                if schedule.due(k * n0 + t):
+                    schedule.record(k * n0 + t, WT)
+                    if schedule.stopped:
+                        break
+
+        if schedule.stopped:
+            break
+        t0 = 1
 
         # update
-        Wt = WT + 0.0
-        At = AT + 0.0
-        Bt = BT + 0.0
         ALPHAt = np.inner(Am / Tm - Ap / Tp, WT)
 
         # lemma has flaw
@@ -264,55 +319,17 @@ def FSAUC(Xtr,Xte,Ytr,Yte,options,stamp=10):
         else:
             beta = 1e7
 
-    return elapsed_time, roc_auc
-
-
-
-
-
-
-def proj_l1(v,R):
-    '''
-    Projection onto l1 ball by Duchi et al
-    input:
-        v - vector
-        R - radius
-    output:
-        w - projected
-    '''
-
-    n = len(v)
+    # keep the state to resume from
+    if checkpoint is not None:
+        checkpoint.update(v=v, Vt=Vt, VT=VT, Ap=Ap, Am=Am, Tp=Tp, Tm=Tm, pt=pt, alphat=alphat, ALPHAt=ALPHAt,
+                          r=r, D=D, beta=beta, schedule=schedule.state())
 
-    # initialize
-    U = list(range(n))
-    s = 0
-    rho = 0
+    return schedule.elapsed_time, schedule.roc_auc
 
-    # update
-    while U:
-        k = np.random.choice(U)
-        # partition
-        G = [j for j in U if v[j]>=v[k]]
-        L = [j for j in U if v[j]<v[k]]
 
-        # calculate
-        delta_rho = len(G)
-        delta_s = sum(v[G])
 
-        if (s+delta_s) - (rho+delta_rho)*v[k] < R:
-            s += delta_s
-            rho += delta_rho
-            U = L + []
-        else:
-            U = G.pop(k)
 
-    # set
-    theta = (s-R)/rho
 
-    # output
-    w = np.maximum(v - theta,0)
-
-    return w
 
 def alt_proj_dual(alpha, o, D, R, kappa):
     '''
@@ -5,9 +5,12 @@ Date: 3/21/19
 '''
 
 import numpy as np
-import time
-from math import log, exp
-from sklearn.metrics import roc_auc_score
+from math import log, exp, sqrt
+from scipy.sparse import csr_matrix
+from jit import backend
+from rows import check, row, dense_row, is_sparse
+from schedule import Schedule
+from vector import Average, ScaledVector
 
 def proj(x, R):
     '''
@@ -44,12 +47,157 @@ def loss_func(name):
 
     return loss
 
-def reservior(Bt,t,N,M):
+class Buffer:
+    '''
+    Rows of one class with their squared norms and scores rows @ w
+
+    Changes of w are collected while the buffer is not scored and applied in
+    one product, restricted to their support, when it is scored again. A new
+    row only writes its own entry. The sequential update also keeps the Gram
+    matrix of the rows, so pairwise products never need a row by row loop.
+    Storage doubles as rows come in, the Gram matrix is dropped once it would
+    hold more rows than the dimension, as with sequential sampling. Sparse
+    rows keep only their nonzeros and are gathered into a csr matrix for
+    products.
+    '''
+
+    def __init__(self, N, d, gram = False, sparse = False):
+        '''
+        input:
+            N - maximum buffer size, only a first guess for sequential sampling
+            d - dimension
+            gram - keep the Gram matrix of the rows
+            sparse - keep the nonzeros of the rows only
+        '''
+
+        N = max(1, min(N, 1024))
+        self.d = d
+        self.sparse = sparse
+        if sparse:
+            self.nonzeros = []
+            self.csr = None
+        else:
+            self.rows = np.zeros((N, d))
+        self.norms = np.zeros(N)
+        self.scores = np.zeros(N)
+        self.gram = np.zeros((N, N)) if gram else None
+        self.L = 0
+
+        # true scores are factor * (scores + rows @ pending)
+        self.pending = np.zeros(d)
+        self.factor = 1.0
+
+    def __len__(self):
+        return self.L
+
+    def insert(self, k, x, s):
+        '''
+        Write x with score s = x @ w into slot k, k == len(self) appends
+        '''
+
+        if k == len(self.norms):
+            N = 2 * len(self.norms)
+            if not self.sparse:
+                self.rows = np.concatenate((self.rows, np.zeros_like(self.rows)))
+            self.norms = np.concatenate((self.norms, np.zeros_like(self.norms)))
+            self.scores = np.concatenate((self.scores, np.zeros_like(self.scores)))
+            if self.gram is not None and N > self.d:
+                self.gram = None
+            elif self.gram is not None:
+                gram = np.zeros((N, N))
+                gram[:k, :k] = self.gram
+                self.gram = gram
+
+        self.L = max(self.L, k + 1)
+        if self.sparse:
+            ind = np.flatnonzero(x)
+            if k == len(self.nonzeros):
+                self.nonzeros.append((ind, x[ind]))
+            else:
+                self.nonzeros[k] = (ind, x[ind])
+            self.csr = None
+        else:
+            self.rows[k] = x
+        self.norms[k] = x @ x
+        self.scores[k] = s / self.factor - x @ self.pending
+        if self.gram is not None:
+            g = self.matrix() @ x
+            self.gram[k, :self.L] = g
+            self.gram[:self.L, k] = g
+
+    def row(self, i):
+        '''
+        Row i as indices and values, a full slice for dense rows
+        '''
+
+        if self.sparse:
+            return self.nonzeros[i]
+        return slice(None), self.rows[i]
+
+    def matrix(self):
+        '''
+        The rows as a dense array, or as a csr matrix gathered once per change
+        '''
+
+        if not self.sparse:
+            return self.rows[:self.L]
+
+        if self.csr is None:
+            ind = [np.zeros(0, dtype=int)] + [ind for ind, _ in self.nonzeros]
+            val = [np.zeros(0)] + [val for _, val in self.nonzeros]
+            indptr = np.cumsum([0] + [len(i) for i in ind[1:]])
+            self.csr = csr_matrix((np.concatenate(val), np.concatenate(ind), indptr), shape=(self.L, self.d))
+        return self.csr
+
+    def combine(self, coef):
+        '''
+        coef @ rows as a dense vector
+        '''
+
+        if self.sparse:
+            return self.matrix().T @ coef
+        return coef @ self.rows[:self.L]
+
+    def update(self, supp, delta, p = 1.0):
+        '''
+        Record that w changed to p * (w + delta)
+        input:
+            supp - support of delta
+            delta - values of delta on supp
+            p - projection factor
+        '''
+
+        self.pending[supp] += delta / self.factor
+        self.factor *= p
+
+    def sync(self):
+        '''
+        Apply the recorded changes and return the scores
+        '''
+
+        L = self.L
+        supp = np.flatnonzero(self.pending)
+        if len(supp) > 0:
+            if self.sparse:
+                self.scores[:L] += self.matrix() @ self.pending
+            elif len(supp) < len(self.pending) // 4:
+                self.scores[:L] += self.rows[:L, supp] @ self.pending[supp]
+            else:
+                self.scores[:L] += self.rows[:L] @ self.pending
+            self.pending[supp] = 0.0
+        if self.factor != 1.0:
+            self.scores[:L] *= self.factor
+            self.factor = 1.0
+
+        return self.scores[:L]
+
+def reservior(Bt,x,s,N,M):
     '''
     Reservior Sampling
     input:
         Bt - current buffer
-        xt - a training instance
+        x - a training instance
+        s - its score
         N - the buffer size
         M - the number of instances received till trial t
     output:
@@ -58,15 +206,137 @@ def reservior(Bt,t,N,M):
 
     L = len(Bt)
     if L < N:
-        Bt.append(t)
+        Bt.insert(L, x, s)
     else:
         z = np.random.binomial(1, p=N/M)
         if z == 1:
             ind = np.random.randint(L)
-            Bt[ind] = t
+            Bt.insert(ind, x, s)
 
     return Bt
 
+def gradient(wt, st, ind_t, xt, y, B, Bo, ct, R):
+    '''
+    Gradient update against every buffered instance of the other class
+    input:
+        wt - ScaledVector iterate, updated in place
+        st - score of current instance
+        ind_t, xt - current instance as indices and values
+        y - label of current instance
+        B - buffer of the other class
+        Bo - buffer of the current class
+        ct - step size
+        R - radius
+    '''
+
+    supp = np.zeros(0, dtype=int)
+    delta = np.zeros(0)
+    if len(B) > 0:
+        # all pairs are checked against the iterate at the start of the step
+        mask = (y * (st - B.sync()) <= 1)
+        k = np.count_nonzero(mask)
+        if k > 0:
+            # gather the violating dense rows only when they are few
+            if k < len(B) // 16 and not B.sparse:
+                delta = -ct * y * B.rows[np.flatnonzero(mask)].sum(axis=0) / 2
+            else:
+                delta = -ct * y * B.combine(mask.astype(float)) / 2
+            delta[ind_t] += ct * y * k * xt / 2
+            supp = np.flatnonzero(delta)
+            delta = delta[supp]
+            wt.add(supp, delta)
+
+    p = wt.proj(R)
+    B.update(supp, delta, p)
+    Bo.update(supp, delta, p)
+
+def sequential(wt, st, ind_t, xt, x, y, B, Bo, ct, R, loss):
+    '''
+    Passive aggressive updates against the buffered instances one at a time
+
+    With a Gram matrix the iterate is followed through its products with the
+    current instance and the buffered rows, O(N) per pair, otherwise a dense
+    copy of it is updated, O(d) per pair. It is written back once.
+    input:
+        wt - ScaledVector iterate, updated in place
+        st - score of current instance
+        ind_t, xt - current instance as indices and values
+        x - current instance as a dense vector
+        y - label of current instance
+        B - buffer of the other class
+        Bo - buffer of the current class
+        ct - step size
+        R - radius
+        loss - loss function
+    '''
+
+    L = len(B)
+    if L == 0:
+        return
+
+    gx = B.matrix() @ x
+    sq_t = xt @ xt
+    s = B.sync()
+    sq = wt.sqnorm()
+
+    # w = f * (w0 + delta)
+    f = 1.0
+    if B.gram is not None:
+        # delta = alpha * x - beta @ rows
+        alpha = 0.0
+        beta = np.zeros(L)
+    else:
+        w = wt.toarray()
+        w0 = w.copy()
+
+    for i in range(L):
+        ind_i, x_i = B.row(i)
+        prod = st - (s[i] if B.gram is not None else w[ind_i] @ x_i)
+        norm = sq_t - 2 * gx[i] + B.norms[i]
+        if norm == 0:
+            tau = ct / 2
+        else:
+            tau = min(ct / 2, loss(prod * y) / norm)
+
+        # w += tau * y * (x - rows[i])
+        c1 = tau * y
+        sq += 2 * c1 * prod + c1 * c1 * norm
+        st += c1 * (sq_t - gx[i])
+        if B.gram is not None:
+            s += c1 * (gx - B.gram[:L, i])
+            alpha += c1 / f
+            beta[i] += c1 / f
+        elif B.sparse:
+            w += c1 * x
+            w[ind_i] -= c1 * x_i
+        else:
+            w += c1 * (x - x_i)
+
+        # projection
+        if sq > R * R:
+            p = R / sqrt(sq)
+            sq = R * R
+            st *= p
+            f *= p
+            if B.gram is not None:
+                s *= p
+            else:
+                w *= p
+
+    if B.gram is not None:
+        delta = -B.combine(beta)
+        delta[ind_t] += alpha * xt
+    else:
+        delta = w / f - w0
+    supp = np.flatnonzero(delta)
+    delta = delta[supp]
+
+    wt.mix(f, 0.0)
+    wt.add(supp, f * delta)
+    if B.gram is None:
+        B.update(supp, delta, f)  # the Gram path followed the scores of B already
+    Bo.update(supp, delta, f)
+
 def OAM(Xtr,Xte,Ytr,Yte,options,stamp = 10):
     '''
     Online AUC Maximization
@@ -77,9 +347,9 @@ def OAM(Xtr,Xte,Ytr,Yte,options,stamp = 10):
         c - penalty parameter
         Np - maximum buffer size of positive samples
         Nn - maximum buffer size of negative samples
-        Xtr -
+        Xtr - dense or csr
         Ytr -
-        Xte -
+        Xte - dense or csr
         Yte -
         stamp - record stamp
     output:
@@ -100,101 +370,86 @@ def OAM(Xtr,Xte,Ytr,Yte,options,stamp = 10):
     print('OAM with loss = %s sampling = %s option = %s Np = %d Nn = %d R = %.2f c = %.2f' %(name,sampling,option,Np,Nn,R,c))
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     n, d = Xtr.shape
 
+    # no compiled loop, its buffer updates are already matrix work
+    if backend(options, Xtr) == 'numba':
+        print('OAM has no Numba kernel, using NumPy backend!')
+
     # define loss function
     loss = loss_func(name)
 
     # initialize
-    wt = np.zeros(d)
-    Bpt = []
-    Bnt = []
+    wt = ScaledVector(np.zeros(d))
+    # Gram matrices pay off while buffers are smaller than the dimension,
+    # rows of sparse features are kept sparse
+    Bpt = Buffer(Np, d, option == 'sequential' and Np < d, is_sparse(Xtr))
+    Bnt = Buffer(Nn, d, option == 'sequential' and Nn < d, is_sparse(Xtr))
     Npt = 0
     Nnt = 0
 
-    # restore average wt
-    avgwt = wt+0.0
+    # restore average wt, w lazily
+    avg = Average(wt)
+    avgwt = np.zeros(d)
 
-    # record auc
-    roc_auc = []
+    # evaluation schedule and records, resumed from a paused run
+    schedule = Schedule(Xte, Yte, options, T, stamp)
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        wt, avg, Bpt, Bnt, Npt, Nnt = (checkpoint[key] for key in ('wt', 'avg', 'Bpt', 'Bnt', 'Npt', 'Nnt'))
+        np.random.set_state(checkpoint['random'])
+        schedule.restore(checkpoint['schedule'])
 
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-
-    for t in range(1,T+1):
+    for t in range(schedule.t + 1, T + 1):
+        # current instance as nonzeros and as a dense vector for the buffers
+        ind_t, xt = row(Xtr, t%n)
+        x = dense_row(Xtr, t%n)
+        st = wt.dot(ind_t, xt)
         if Ytr[t%n] == 1:
             Npt += 1
             if sampling == 'reservoir':
                 ct = c*max(1,Nnt/Nn)
-                Bpt = reservior(Bpt,t%n,Np,Npt)
+                Bpt = reservior(Bpt,x,st,Np,Npt)
             elif sampling == 'sequential':
                 ct = c
-                Bpt.append(t%n)
+                Bpt.insert(len(Bpt),x,st)
             else:
                 print('wrong sampling option!')
                 return
-            if option == 'sequential':
-                for i in Bnt:
-                    prod = wt @ (Xtr[t%n] - Xtr[i])
-                    norm = (Xtr[t%n] - Xtr[i]) @ (Xtr[t%n] - Xtr[i])
-                    if norm == 0:
-                        tau = ct / 2
-                    else:
-                        tau = min(ct / 2, loss(prod * Ytr[t%n]) / norm)
-                    wt += tau * Ytr[t%n] * (Xtr[t%n] - Xtr[i])
-                    wt = proj(wt, R)
-
-            elif option == 'gradient':
-                w = wt + 0.0
-                for i in Bnt:
-                    prod = wt @ (Xtr[t%n] - Xtr[i])
-                    if Ytr[t%n] * prod <= 1:
-                        wt += ct * Ytr[t%n] * (Xtr[t%n] - Xtr[i]) / 2
-
-                wt = proj(wt, R)
-            else:
-                print('Wrong update option!')
-                return
+            Bt, Bo = Bnt, Bpt
         else:
             Nnt += 1
             if sampling == 'reservoir':
                 ct = c*max(1,Npt/Np)
-                Bnt = reservior(Bnt,t%n,Nn,Nnt)
+                Bnt = reservior(Bnt,x,st,Nn,Nnt)
             elif sampling == 'sequential':
                 ct = c
-                Bnt.append(t%n)
+                Bnt.insert(len(Bnt),x,st)
             else:
                 print('Wrong sampling option!')
                 return
-            if option == 'sequential':
-                for i in Bpt:
-                    prod = wt @ (Xtr[t%n] - Xtr[i])
-                    norm = (Xtr[t%n] - Xtr[i]) @ (Xtr[t%n] - Xtr[i])
-                    if norm == 0:
-                        tau = ct / 2
-                    else:
-                        tau = min(ct / 2, loss(prod * Ytr[t%n]) / norm)
-                    wt += tau * Ytr[t%n] * (Xtr[t%n] - Xtr[i])
-                    wt = proj(wt, R)
-            elif option == 'gradient':
-                w = wt + 0.0
-                for i in Bpt:
-                    prod = w @ (Xtr[t%n] - Xtr[i])
-                    if Ytr[t % n] * prod <= 1:
-                        wt += ct * Ytr[t % n] * (Xtr[t % n] - Xtr[i]) / 2
-                wt = proj(wt, R)
-            else:
-                print('Wrong update option!')
-                return
+            Bt, Bo = Bpt, Bnt
+
+        # update against the buffer of the other class
+        if option == 'sequential':
+            sequential(wt, st, ind_t, xt, x, Ytr[t%n], Bt, Bo, ct, R, loss)
+        elif option == 'gradient':
+            gradient(wt, st, ind_t, xt, Ytr[t%n], Bt, Bo, ct, R)
+        else:
+            print('Wrong update option!')
+            return
 
         # write results
-        elapsed_time.append(time.time() - start_time)
-        avgwt = ((t-1)*avgwt + wt) / t
-        roc_auc.append(roc_auc_score(Yte, Xte @ avgwt))
+        avg.step()
+        if schedule.due(t):
+            schedule.record(t, avg.mean(avgwt))
+            if schedule.stopped:
+                break
 
-        # running log
-        if t % stamp == 0:
-            print('iteration: %d AUC: %.6f time eplapsed: %.2f' % (t, roc_auc[-1], elapsed_time[-1]))
+    # keep the state to resume from, reservoir sampling included
+    if checkpoint is not None:
+        checkpoint.update(wt=wt, avg=avg, Bpt=Bpt, Bnt=Bnt, Npt=Npt, Nnt=Nnt, random=np.random.get_state(),
+                          schedule=schedule.state())
 
-    return elapsed_time, roc_auc
\ No newline at end of file
+    return schedule.elapsed_time, schedule.roc_auc
\ No newline at end of file
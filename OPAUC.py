@@ -5,9 +5,10 @@ Date: 3/21/19
 '''
 
 import numpy as np
-import time
 from math import sqrt
-from sklearn.metrics import roc_auc_score
+from jit import backend
+from rows import check, dense_row
+from schedule import Schedule
 
 def proj(x, R):
     '''
@@ -23,15 +24,145 @@ def proj(x, R):
         x = x / norm * R
     return x
 
+class Covariance:
+    '''
+    Running mean and covariance of one class as a d x d matrix
+
+    Only used while d < tau, where it is smaller than a sketch.
+    '''
+
+    def __init__(self, d):
+        self.T = 0
+        self.c = np.zeros(d)
+        self.Gamma = np.zeros((d, d))
+
+    def update(self, x):
+        '''
+        Add an instance
+        '''
+
+        self.T += 1
+        temp = self.c
+        self.c = self.c + (x - self.c) / self.T
+
+        # Gamma + (x x^T - Gamma) / T + temp temp^T - c c^T as one rank three update
+        U = np.stack((x, temp, self.c), axis=1)
+        self.Gamma *= 1 - 1 / self.T
+        self.Gamma += (U * [1 / self.T, 1, -1]) @ U.T
+
+    def matvec(self, w):
+        '''
+        Gamma @ w
+        '''
+
+        return self.Gamma @ w
+
+class Sketch:
+    '''
+    Running mean and randomly projected covariance of one class
+
+    Gamma = G G^T / T - k c' c'^T is kept as the d x tau factor G and a
+    rank one mean correction, Gamma @ w is G @ (G^T @ w) / T minus the
+    correction, O(d * tau) without any d x d matrix.
+    '''
+
+    def __init__(self, d, tau):
+        self.T = 0
+        self.tau = tau
+        self.c = np.zeros(d)
+        self.G = np.zeros((d, tau))
+        self.R = np.zeros(tau) # record accumulative gaussian vectors
+
+        # mean correction c' c'^T scaled by k
+        self.cc = np.zeros(d)
+        self.k = 0.0
+
+    def update(self, x):
+        '''
+        Add an instance
+        '''
+
+        # correction from the mean before this instance, as c_hat = c R^T / T did
+        if self.T > 0:
+            self.cc = self.c
+            self.k = (self.R @ self.R) / self.T ** 2
+
+        rt = np.random.randn(self.tau)
+        self.R += rt / self.tau
+        self.G += np.outer(x, rt / sqrt(self.tau))  # note there is typo in icml version
+        self.T += 1
+        self.c = self.c + (x - self.c) / self.T
+
+    def matvec(self, w):
+        '''
+        Gamma @ w
+        '''
+
+        if self.T == 0:
+            return np.zeros_like(w)
+        return self.G @ (self.G.T @ w) / self.T - self.k * (self.cc @ w) * self.cc
+
+class FrequentDirections:
+    '''
+    Running mean and frequent directions sketch of one class
+
+    The tau x d sketch B keeps B^T B close to the sum of x x^T. When B is
+    full its singular values are shrunk by the median one, which frees half
+    of the rows, so the SVD costs O(d * tau) per instance on average.
+    Gamma @ w is B^T (B w) / T - c (c^T w), deterministic and without any
+    d x d matrix.
+    '''
+
+    def __init__(self, d, tau):
+        self.T = 0
+        self.c = np.zeros(d)
+        self.B = np.zeros((tau, d))
+        self.next = 0 # first zero row of B
+
+    def update(self, x):
+        '''
+        Add an instance
+        '''
+
+        if self.next == len(self.B):
+            self.shrink()
+        self.B[self.next] = x
+        self.next += 1
+
+        self.T += 1
+        self.c = self.c + (x - self.c) / self.T
+
+    def shrink(self):
+        '''
+        Shrink the singular values of B to free its lower half
+        '''
+
+        U, s, Vt = np.linalg.svd(self.B, full_matrices=False)
+        half = len(self.B) // 2
+        s = np.sqrt(np.maximum(s ** 2 - s[half] ** 2, 0))
+        self.B[:] = 0
+        self.B[:len(s)] = s[:, None] * Vt
+        self.next = half
+
+    def matvec(self, w):
+        '''
+        Gamma @ w
+        '''
+
+        if self.T == 0:
+            return np.zeros_like(w)
+        return self.B.T @ (self.B @ w) / self.T - (self.c @ w) * self.c
+
 def OPAUC(Xtr,Xte,Ytr,Yte, options,stamp = 10):
     '''
     One-Pass AUC Optimization
     input:
-        Xtr -
+        Xtr - dense or csr
         Ytr -
-        Xte -
+        Xte - dense or csr
         Yte -
-        options -
+        options - 'sketch' is 'random' (default) for Gaussian projections or
+                  'fd' for frequent directions, used when d >= tau
     output:
         elapsed_time -
         roc_auc -
@@ -42,100 +173,77 @@ def OPAUC(Xtr,Xte,Ytr,Yte, options,stamp = 10):
     c = options['c']
     R = options['R'] # modified algorithm to be bounded not regularized
     tau = options['tau']
+    sketch = options.get('sketch', 'random')
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     n, d = Xtr.shape
 
+    # no compiled loop, its covariance updates are already matrix work
+    if backend(options, Xtr) == 'numba':
+        print('OPAUC has no Numba kernel, using NumPy backend!')
+
     # choose to approximate or not
     if d<tau:
         print('OPAUC with R = %.2f c  = %.2f dimension = %d' % (R, c, d))
         cov = 'full'
     else:
-        print('OPAUC with R = %.2f c  = %.2f dimension = %d tau = %d' %(R,c,d,tau))
+        print('OPAUC with R = %.2f c  = %.2f dimension = %d tau = %d sketch = %s' %(R,c,d,tau,sketch))
         cov = 'approximate'
 
     # initialize
     wt = np.zeros(d)
-    Tpt = 0
-    Tnt = 0
-    cpt = np.zeros(d)
-    cnt = np.zeros(d)
     if cov == 'full':
-        Gammapt = np.zeros((d,d))
-        Gammant = np.zeros((d,d))
-    elif cov == 'approximate':
-        Gammapt = np.zeros((d,tau))
-        Gammant = np.zeros((d,tau))
-        Rpt = np.zeros(tau) # record accumulative gaussian vectors
-        Rnt = np.zeros(tau)
-        # store for convenience
-        cpt_hat = np.zeros((d,tau))
-        cnt_hat = np.zeros((d,tau))
-        Spt_hat = np.zeros((d,d))
-        Snt_hat = np.zeros((d,d))
+        covp = Covariance(d)
+        covn = Covariance(d)
+    elif sketch == 'random':
+        covp = Sketch(d, tau)
+        covn = Sketch(d, tau)
+    elif sketch == 'fd':
+        covp = FrequentDirections(d, tau)
+        covn = FrequentDirections(d, tau)
     else:
-        print('Wrong covariance option!')
+        print('Wrong sketch option!')
         return
 
-    # record auc
-    roc_auc = []
+    # evaluation schedule and records, resumed from a paused run
+    schedule = Schedule(Xte, Yte, options, T, stamp)
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        wt, covp, covn = checkpoint['wt'], checkpoint['covp'], checkpoint['covn']
+        np.random.set_state(checkpoint['random'])
+        schedule.restore(checkpoint['schedule'])
 
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-    for t in range(1,T+1):
+    for t in range(schedule.t + 1, T + 1):
 
         # step size
         eta = c / sqrt(t)
 
+        # covariance updates are dense anyway
+        xt = dense_row(Xtr, t % n)
+
         if Ytr[t % n] == 1:
-            Tpt += 1
-            if cov == 'full':
-                temp = cpt + 0.0 #
-                cpt = cpt + (Xtr[t % n] - cpt) / Tpt
-                Gammapt = Gammapt + (np.outer(Xtr[t%n], Xtr[t%n]) - Gammapt)/Tpt + np.outer(temp,temp) - np.outer(cpt,cpt)
-                gwt = -Xtr[t%n] + cnt + (np.outer(Xtr[t%n] - cnt, Xtr[t%n] - cnt) + Gammant)@wt
-            elif cov == 'approximate':
-                rt = np.random.randn(tau)
-                Rpt += rt/tau
-                Gammapt = Gammapt + np.outer(Xtr[t % n], rt) / sqrt(tau)  # note there is typo in icml version
-                Spt_hat = Gammapt @ Gammapt.transpose() / Tpt - cpt_hat @ cpt_hat.transpose()
-                cpt = cpt + (Xtr[t % n] - cpt) / Tpt
-
-                cpt_hat = np.outer(cpt,Rpt)/Tpt
-                gwt = -Xtr[t%n] + cnt + (np.outer(Xtr[t%n] - cnt, Xtr[t%n] - cnt) + Snt_hat)@wt
-            else:
-                print('Wrong covariance option!')
-                return
+            covp.update(xt)
+            other = covn
         else:
-            Tnt += 1
-            if cov == 'full':
-                temp = cnt + 0.0
-                cnt = cnt + (Xtr[t % n] - cnt) / Tnt
-                Gammant = Gammant + (np.outer(Xtr[t % n], Xtr[t % n]) - Gammant) / Tnt + np.outer(temp, temp) - np.outer(cnt, cnt)
-                gwt = Xtr[t % n] - cpt + (np.outer(Xtr[t % n] - cpt, Xtr[t % n] - cpt) + Gammapt) @ wt
-            elif cov == 'approximate':
-                rt = np.random.randn(tau)
-                Rnt += rt/tau
-                Gammant = Gammant + np.outer(Xtr[t % n], rt) / sqrt(tau)  # note there is typo in icml version
-                Snt_hat = Gammant @ Gammant.transpose() / Tnt - cnt_hat @ cnt_hat.transpose()
-                cnt = cnt + (Xtr[t % n] - cnt) / Tnt
-
-                cnt_hat = np.outer(cnt, Rnt) / Tnt
-                gwt = Xtr[t % n] - cpt + (np.outer(Xtr[t % n] - cpt, Xtr[t % n] - cpt) + Spt_hat) @ wt
-            else:
-                print('Wrong covariance option!')
-                return
+            covn.update(xt)
+            other = covp
+
+        # (x - c)(x - c)^T @ w + Gamma @ w for the other class
+        zt = xt - other.c
+        gwt = -Ytr[t % n] * zt + (zt @ wt) * zt + other.matvec(wt)
 
         # gradient descent
         wt = proj(wt - eta * gwt, R)
 
         # write results
-        elapsed_time.append(time.time() - start_time)
-        roc_auc.append(roc_auc_score(Yte, np.dot(Xte, wt)))
+        if schedule.due(t):
+            schedule.record(t, wt)
+            if schedule.stopped:
+                break
 
-        # running log
-        if t % stamp == 0:
-            print('iteration: %d AUC: %.6f time eplapsed: %.2f' % (t, roc_auc[-1], elapsed_time[-1]))
+    # keep the state to resume from, random projections included
+    if checkpoint is not None:
+        checkpoint.update(wt=wt, covp=covp, covn=covn, random=np.random.get_state(), schedule=schedule.state())
 
-    return elapsed_time, roc_auc
\ No newline at end of file
+    return schedule.elapsed_time, schedule.roc_auc
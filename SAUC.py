@@ -4,64 +4,86 @@ Author: Zhenhuan(Neyo) Yang
 Date: 4/8/19
 '''
 
+import os
 import numpy as np
-from math import fabs, sqrt, log, exp, factorial
-import time
-from sklearn.metrics import roc_auc_score
+from fractions import Fraction
+from functools import lru_cache
+from math import sqrt, log, exp
+from jit import arrays, backend, sauc_steps, segments
+from rows import check, row
+from schedule import Schedule
+from vector import Average, ScaledVector
 
 def comb(N):
     '''
-    Compute combination
+    Compute combination by Pascal's triangle, no factorials
     input:
         N - degree of Bernstein
     output:
         c - combination dictionary
     '''
 
-    c = {}
-    for n in range(N + 1):
-        c[n] = np.zeros(n + 1)
-        for k in range(n + 1):
-            c[n][k] = factorial(n) / factorial(k) / factorial(n - k)
+    c = {0: np.ones(1)}
+    for n in range(1, N + 1):
+        c[n] = np.ones(n + 1)
+        c[n][1:n] = c[n - 1][:-1] + c[n - 1][1:]
     return c
 
+def forward(N, loss):
+    '''
+    Compute the table of forward differences of the loss on the grid j / N
+    input:
+        N - degree of Bernstein
+        loss - loss function
+    output:
+        delta - delta[i, j] is the i-th forward difference at j / N, zero for j > N - i
+    '''
+
+    # exact on the samples, piecewise linear losses are exact on rationals
+    # and float samples convert to Fraction without rounding, so the table
+    # is rounded once at the end instead of losing 2 ** i bits down it
+    f = [Fraction(loss(Fraction(j, N))) for j in range(N + 1)]
+    delta = np.zeros((N + 1, N + 1))
+    for i in range(N + 1):
+        delta[i, :N - i + 1] = [float(v) for v in f]
+        f = [b - a for a, b in zip(f[:-1], f[1:])]
+
+    return delta
+
+def shift(N, comb_dict, weight):
+    '''
+    Arrange comb_dict[k][i] * weight[k] into rows by i and columns by k - i
+    '''
+
+    A = np.zeros((N + 1, N + 1))
+    for i in range(N + 1):
+        A[i, :N - i + 1] = [comb_dict[k][i] for k in range(i, N + 1)]
+        A[i, :N - i + 1] *= weight[i:]
+    return A
+
 def bound(N, loss, L, comb_dict):
 
     '''
     Calculate annoying parameters to estimate gamma
     '''
 
-    R1 = 0.0
-    R2 = 0.0
-    Sp1 = 0.0
-    Sm1 = 0.0
-    Sp2 = 0.0
-    Sm2 = 0.0
-    for i in range(N + 1):
-        # compute plus
-        alpha0 = L ** i
-        alpha1 = i * L ** (i - 1)
-        alpha2 = i * (i - 1) * L ** (i - 2)
-        R1 += alpha0
-        Sp1 += alpha1
-        Sp2 += alpha2
-        # compute minus
-        beta0 = 0.0
-        beta1 = 0.0
-        beta2 = 0.0
-        for k in range(i, N + 1):
-            # compute forward difference
-            delta = 0.0
-            for j in range(k + 1):
-                delta += comb_dict[k][j] * (-1) ** (k - j) * loss(j / N)
-            # compute coefficient
-            beta0 += comb_dict[N][k] * comb_dict[k][i] * (N + 1) * fabs(delta) / (2 ** k) / (L ** i)
-            beta1 += comb_dict[N][k] * comb_dict[k][i] * (N + 1) * (k - i) * fabs(delta) / (2 ** k) / (L ** (i + 1))
-            beta2 += comb_dict[N][k] * comb_dict[k][i] * (N + 1) * (k - i) * (k - i - 1) * fabs(delta) / (2 ** k) / (
-                        L ** (i + 2))
-        R2 += beta0
-        Sm1 += beta1
-        Sm2 += beta2
+    i = np.arange(N + 1)
+
+    # compute plus
+    R1 = np.sum(np.power(float(L), i))
+    Sp1 = np.sum(i[1:] * np.power(float(L), i[1:] - 1))
+    Sp2 = np.sum(i[2:] * (i[2:] - 1) * np.power(float(L), i[2:] - 2))
+
+    # compute minus, scale through logs so large N does not overflow
+    delta = np.abs(forward(N, loss)[:, 0])
+    weight = np.exp(np.log(comb_dict[N]) - i * log(2)) * (N + 1) * delta
+    A = shift(N, comb_dict, weight)
+    beta0 = A.sum(axis=1) / np.power(float(L), i)
+    beta1 = A @ i / np.power(float(L), i + 1)
+    beta2 = A @ (i * (i - 1)) / np.power(float(L), i + 2)
+    R2 = np.sum(beta0)
+    Sm1 = np.sum(beta1)
+    Sm2 = np.sum(beta2)
 
     gamma = max((2 * R1 + R2) * Sp2 + Sp1 ** 2, (2 * R2 + R1) * Sm2 + Sm1 ** 2) / (N + 1)
 
@@ -87,6 +109,9 @@ def bern_loss_func(name, L):
         loss - loss function
     '''
 
+    # exact for rational x so forward differences can be taken exactly
+    L = Fraction(L)
+
     if name == 'hinge':
         loss = lambda x: max(0, 1 + L - 2 * L * x)
     elif name == 'logistic':
@@ -104,7 +129,7 @@ def pos(N, prod, L):
 
     input:
         i - index of function
-        prod - wt*xt
+        prod - wt*xt, a scalar or an array of them
         L - bound on prod
 
     output:
@@ -112,10 +137,10 @@ def pos(N, prod, L):
         gfpt - positive function gradient
     '''
 
-    plus = L / 2 + prod
-    p = list(range(N + 1))
-    fpt = np.power(plus, p)
-    gfpt = np.multiply(fpt, p) / plus  # no xt yet!
+    plus = L / 2 + np.asarray(prod)
+    p = np.arange(N + 1)
+    fpt = np.power(plus[..., None], p)
+    gfpt = np.multiply(fpt, p) / plus[..., None]  # no xt yet!
 
     return fpt, gfpt
 
@@ -129,23 +154,26 @@ def coef(N, loss, L, comb_dict):
         L -
         comb_dict -
     output:
-        beta - coefficient dictionary
-        gbeta - gradient coefficient dictionary
+        beta - coefficient matrix, beta[i, j] multiplies u ** j * (1 - u) ** (N - i - j)
+            with u = (L / 2 - prod) / (2 * L)
+        gbeta - gradient coefficient matrix, same for degree N - i - 1
     '''
 
-    beta = {}
-    gbeta = {}
-    for i in range(N + 1):
-        beta[i] = np.zeros(N - i + 1)
-        gbeta[i] = np.zeros(N - i + 1)
-        for k in range(i, N + 1):
-            # compute forward difference
-            delta = 0.0
-            for j in range(k + 1):
-                delta += comb_dict[k][j] * (-1) ** (k - j) * loss(j / N)
-            # compute coefficient
-            beta[i][k - i] = comb_dict[N][k] * comb_dict[k][i] * (N + 1) * delta / ((2 * L) ** k)
-            gbeta[i][k - i] = beta[i][k - i] * (k - i)
+    # the negative function i is the i-th Taylor coefficient of the Bernstein
+    # polynomial, a Bernstein polynomial of degree N - i whose coefficients
+    # are the i-th forward differences, scaled through logs for large N
+    i = np.arange(N + 1)
+    delta = forward(N, loss)
+    scale = np.log(comb_dict[N]) - i * log(2 * L) + log(N + 1)
+    basis = np.zeros((N + 1, N + 1))
+    for k in range(N + 1):
+        basis[k, :N - k + 1] = np.log(comb_dict[N - k])
+    with np.errstate(divide='ignore'):
+        beta = np.sign(delta) * np.exp(scale[:, None] + basis + np.log(np.abs(delta)))
+
+    # the derivative in L / 2 - prod of the function i is i + 1 times the function i + 1
+    gbeta = np.zeros((N + 1, N + 1))
+    gbeta[:N] = beta[1:] * i[1:, None]
 
     return beta, gbeta
 
@@ -154,33 +182,84 @@ def neg(N, prod, L, beta, gbeta):
     Compute negative function and gradient information
     input:
         N -
-        loss - loss function
-        prod - wt*xt
+        prod - wt*xt, a scalar or an array of them
         L -
-        beta - coefficient
+        beta - coefficient matrix
+        gbeta - gradient coefficient matrix
     output:
         fnt - negative function value
         gfnt - negative function gradient
-        wasted - time wasted on computing
     '''
 
-    minus = L / 2 - prod
-    p = list(range(N + 1))
-    # exponent
-    exponent = np.power(minus, p)
-
-    fnt = np.zeros(N + 1)
-    gfnt = np.zeros(N + 1)
+    # Bernstein basis u ** j * (1 - u) ** (n - j) as (1 - u) ** n * r ** j,
+    # u stays in [0, 1 / 2] for |prod| <= L / 2 so r = u / (1 - u) <= 1
+    u = (L / 2 - np.asarray(prod)) / (2 * L)
+    r = u / (1 - u)
+    p = np.arange(N + 1)
+    exponent = np.power(r[..., None], p)
+    scale = np.power((1 - u)[..., None], N - p)
 
-    for i in range(N + 1):
-        # compute function value
-        fnt[i] = np.inner(beta[i], exponent[:N - i + 1])
+    # all function values by one matrix-vector product
+    fnt = (exponent @ beta.T) * scale
 
-        # compute gradient
-        gfnt[i] = np.inner(gbeta[i], exponent[:N - i + 1]) / minus  # no xt yet!
+    # degree N - i - 1, gbeta[N] is zero
+    gfnt = (exponent[..., :N] @ gbeta[:, :N].T) * scale / (1 - u)[..., None]  # no xt yet!
 
     return fnt, gfnt
 
+@lru_cache(maxsize=32)
+def bern_coef(name, N, L, path = None):
+    '''
+    Coefficients and bounds, memoized in process and optionally on disk
+
+    The coefficients are evaluated in the Bernstein basis and stay accurate
+    for N in the hundreds, the bound gamma grows like N ** 2 * L ** N and
+    degrees where it or a coefficient leaves the float range are refused.
+    input:
+        name - name of loss function
+        N - degree of Bernstein
+        L - bound for prod
+        path - directory of the .npz store, None to keep in memory only
+    output:
+        beta - coefficient matrix
+        gbeta - gradient coefficient matrix
+        R1, R2, gamma - bounds
+    '''
+
+    if path is not None:
+        filename = os.path.join(path, 'bernstein_%s_%d_%r.npz' % (name, N, float(L)))
+        if os.path.isfile(filename):
+            with np.load(filename) as f:
+                beta, gbeta = f['beta'], f['gbeta']
+                R1, R2, gamma = float(f['R1']), float(f['R2']), float(f['gamma'])
+        else:
+            beta, gbeta, R1, R2, gamma = bern_coef(name, N, L, None)
+            # write then rename so concurrent runs never read half a file
+            os.makedirs(path, exist_ok=True)
+            temp = '%s.%d.tmp' % (filename, os.getpid())
+            with open(temp, 'wb') as f:
+                np.savez(f, beta=beta, gbeta=gbeta, R1=R1, R2=R2, gamma=gamma)
+            os.replace(temp, filename)
+    else:
+        # define loss function
+        loss = bern_loss_func(name, L)
+
+        # compute combinations and coefficients
+        comb_dict = comb(N)
+        beta, gbeta = coef(N, loss, L, comb_dict)
+
+        # compute gamma
+        with np.errstate(over='ignore'):
+            R1, R2, gamma = bound(N, loss, L, comb_dict)
+        if not (np.isfinite(gamma) and np.all(np.isfinite(beta))):
+            raise ValueError('Bernstein degree N = %d overflows for L = %g, lower N or R' % (N, L))
+
+    # shared between runs
+    beta.flags.writeable = False
+    gbeta.flags.writeable = False
+
+    return beta, gbeta, R1, R2, gamma
+
 
 def proj(x, R):
     '''
@@ -208,10 +287,13 @@ def SAUC(Xtr,Xte,Ytr,Yte,options,stamp = 1):
         N - Bernstein degree
         L - Bound for prod
         c - step size parameter
-        Xtr - Training features
+        batch_size - number of samples per inner update, default 1
+        Xtr - Training features, dense or csr
         Ytr - Training labels
-        Xte - Testing features
+        Xte - Testing features, dense or csr
         Yte - Testing labels
+        cache - directory caching Bernstein coefficients, optional
+        eval - evaluation schedule, see schedule.Schedule
         stamp - record stamp
 
     output:
@@ -226,10 +308,11 @@ def SAUC(Xtr,Xte,Ytr,Yte,options,stamp = 1):
     R = options['R']
     L = 2 * R #* max(np.linalg.norm(Xtr, axis=1))
     c = options['c']
-    # B = options['B']
+    B = options.get('batch_size', 1)
     # sampling = options['sampling']
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     n, d = Xtr.shape
 
     WT = np.zeros(d)
@@ -237,93 +320,146 @@ def SAUC(Xtr,Xte,Ytr,Yte,options,stamp = 1):
     BT = np.zeros(N + 1)
     ALPHAT = np.zeros(N + 1)
 
-    # define loss function
-    loss = bern_loss_func(name, L)
-
-    # compute combinations and coefficients
-    comb_dict = comb(N)
-    beta, gbeta = coef(N, loss, L, comb_dict)
-
-    # compute gamma
-    R1, R2, gamma = bound(N,loss,L,comb_dict)
+    # coefficients and gamma, cached across runs
+    beta, gbeta, R1, R2, gamma = bern_coef(name, N, L, options.get('cache'))
 
     print('SAUC with loss = %s N = %d R = %d gamma = %.02f c = %d' % (name, N, R, gamma, c))
 
     # restore average wt
     avgwt = WT + 0.0
 
-    # record auc
-    roc_auc = []
-
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-
-    # Begin algorithm
-    for t in range(1, T + 1):
-        # initialize inner loop variables
-        wj = WT + 0.0
-        aj = AT + 0.0
-        bj = BT + 0.0
-        alphaj = ALPHAT + 0.0
-
-        BWt = 0.0
-        BAt = 0.0
-        BBt = 0.0
-        BALPHAt = 0.0
-
-        # step size
-        eta = c / sqrt(t) / gamma
-
-        # inner loop update at j
-        for j in range(t):
-
-            index = (t * (t - 1) // 2 + j) % n
-
-            prod = Xtr[index] @ wj
-
-            fpt, gfpt = pos(N, prod, L)
-            fnt, gfnt = neg(N, prod, L, beta, gbeta)
-
-            # if condition is faster than two inner product!
-            if Ytr[index] == 1:
-                gradwt = 2 * (alphaj - aj) @ gfpt
-                gradat = 2 * (aj - fpt)
-                gradbt = 2 * bj
-                gradalphat = -2 * (alphaj - fpt)
-            else:
-                gradwt = 2 * (alphaj - bj) @ gfnt
-                gradat = 2 * aj
-                gradbt = 2 * (bj - fnt)
-                gradalphat = -2 * (alphaj - fnt)
-
-            wj = wj - eta * (gradwt * Xtr[index] * Ytr[index] / (2 * (N + 1)) + gamma * (wj - WT))
-            aj = aj - eta * gradat / (2 * (N + 1))
-            bj = bj - eta * gradbt / (2 * (N + 1))
-            alphaj = alphaj + eta * gradalphat / (2 * (N + 1))
-
-            wj = proj(wj, R)
-            aj = proj(aj, R1)
-            bj = proj(bj, R2)
-            alphaj = proj(alphaj, R1 + R2)
-
-            BWt += wj
-            BAt += aj
-            BBt += bj
-            BALPHAt += alphaj
-
-        # update outer loop variables
-        WT = BWt / t
-        AT = BAt / t
-        BT = BBt / t
-        ALPHAT = BALPHAt / t
-
-        elapsed_time.append(time.time() - start_time)
-        avgwt = ((t - 1) * avgwt + WT) / t
-
-        roc_auc.append(roc_auc_score(Yte, Xte @ avgwt))
-
-        if t % stamp == 0:
-            print('iteration: %d AUC: %.6f time elapsed: %.2f' % (t, roc_auc[-1], elapsed_time[-1]))
-
-    return elapsed_time, roc_auc
\ No newline at end of file
+    # resume from a paused run
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        WT, AT, BT, ALPHAT, avgwt = (checkpoint[key] for key in ('WT', 'AT', 'BT', 'ALPHAT', 'avgwt'))
+
+    # same iterations, compiled between evaluations
+    compiled = backend(options, Xtr) == 'numba'
+    if compiled and B != 1:
+        print('Numba backend runs batch_size 1 only, using NumPy backend!')
+        compiled = False
+    if compiled:
+        csr = arrays(Xtr)
+        y = np.asarray(Ytr, dtype=float)
+        WT, AT, BT, ALPHAT, avgwt = (np.array(x, dtype=float) for x in (WT, AT, BT, ALPHAT, avgwt))
+        sauc_steps(*csr, y, 1, 0, float(c), float(R), float(L), gamma, R1, R2, beta, gbeta,
+                   WT, AT, BT, ALPHAT, avgwt) # compile off the clock
+
+    # evaluation schedule and records
+    schedule = Schedule(Xte, Yte, options, T, stamp)
+    if checkpoint:
+        schedule.restore(checkpoint['schedule'])
+
+    # an outer iteration is t inner steps, check the clock after each
+    if compiled:
+        for start, stop in segments(schedule, schedule.t + 1, T, steps=1):
+            sauc_steps(*csr, y, start, stop, float(c), float(R), float(L), gamma, R1, R2, beta, gbeta,
+                       WT, AT, BT, ALPHAT, avgwt)
+            if schedule.due(stop):
+                schedule.record(stop, avgwt)
+                if schedule.stopped:
+                    break
+    else:
+        # Begin algorithm
+        for t in range(schedule.t + 1, T + 1):
+            # initialize inner loop variables, wj anchored at WT
+            wj = ScaledVector(WT, WT)
+            avg = Average(wj) # weighted by block size to keep the average over samples
+            aj = AT + 0.0
+            bj = BT + 0.0
+            alphaj = ALPHAT + 0.0
+
+            BAt = 0.0
+            BBt = 0.0
+            BALPHAt = 0.0
+
+            # step size
+            eta = c / sqrt(t) / gamma
+
+            # inner loop update at j
+            for j in range(0, t, B):
+
+                if B == 1:
+                    index = (t * (t - 1) // 2 + j) % n
+                    ind, val = row(Xtr, index)
+
+                    prod = wj.dot(ind, val)
+
+                    fpt, gfpt = pos(N, prod, L)
+                    fnt, gfnt = neg(N, prod, L, beta, gbeta)
+
+                    # if condition is faster than two inner product!
+                    if Ytr[index] == 1:
+                        gradwt = 2 * (alphaj - aj) @ gfpt
+                        gradat = 2 * (aj - fpt)
+                        gradbt = 2 * bj
+                        gradalphat = -2 * (alphaj - fpt)
+                    else:
+                        gradwt = 2 * (alphaj - bj) @ gfnt
+                        gradat = 2 * aj
+                        gradbt = 2 * (bj - fnt)
+                        gradalphat = -2 * (alphaj - fnt)
+
+                    b = 1
+                else:
+                    # a block of samples at once
+                    index = (t * (t - 1) // 2 + np.arange(j, min(j + B, t))) % n
+                    b = len(index)
+
+                    prod = wj.matvec(Xtr[index])
+
+                    fpt, gfpt = pos(N, prod, L)
+                    fnt, gfnt = neg(N, prod, L, beta, gbeta)
+
+                    # average gradients of the block
+                    mask = Ytr[index] == 1
+                    gradwt = np.where(mask, gfpt @ (2 * (alphaj - aj)), gfnt @ (2 * (alphaj - bj)))
+                    gradwt = Xtr[index].T @ (gradwt * Ytr[index]) / b
+                    fp = mask @ fpt / b
+                    fn = ~mask @ fnt / b
+                    gradat = 2 * (aj - fp)
+                    gradbt = 2 * (bj - fn)
+                    gradalphat = -2 * (alphaj - fp - fn)
+
+                # shrink towards WT in O(1), then only touch the nonzeros of xt
+                wj.mix(1 - eta * gamma, eta * gamma)
+                if B == 1:
+                    wj.add(ind, -eta * gradwt * Ytr[index] * val / (2 * (N + 1)))
+                else:
+                    wj.add(slice(None), -eta * gradwt / (2 * (N + 1)))
+                aj = aj - eta * gradat / (2 * (N + 1))
+                bj = bj - eta * gradbt / (2 * (N + 1))
+                alphaj = alphaj + eta * gradalphat / (2 * (N + 1))
+
+                wj.proj(R)
+                aj = proj(aj, R1)
+                bj = proj(bj, R2)
+                alphaj = proj(alphaj, R1 + R2)
+
+                # weight by block size to keep the average over samples, w lazily
+                avg.step(b)
+                BAt += b * aj
+                BBt += b * bj
+                BALPHAt += b * alphaj
+
+            # update outer loop variables
+            WT = avg.mean()
+            AT = BAt / t
+            BT = BBt / t
+            ALPHAT = BALPHAt / t
+
+            avgwt *= t - 1
+            avgwt += WT
+            avgwt /= t
+
+            # write results
+            if schedule.due(t):
+                schedule.record(t, avgwt)
+                if schedule.stopped:
+                    break
+
+    # keep the state to resume from
+    if checkpoint is not None:
+        checkpoint.update(WT=WT, AT=AT, BT=BT, ALPHAT=ALPHAT, avgwt=avgwt, schedule=schedule.state())
+
+    return schedule.elapsed_time, schedule.roc_auc
\ No newline at end of file
@@ -4,9 +4,11 @@ Author: Zhenhuan(Neyo) Yang
 '''
 
 import numpy as np
-import time
-from sklearn.metrics import roc_auc_score
 from math import sqrt
+from jit import arrays, backend, indices, segments, solam_steps
+from rows import check, row
+from schedule import Schedule
+from vector import Average, ScaledVector
 
 def proj(x, R):
     '''
@@ -26,9 +28,9 @@ def SOLAM(Xtr,Xte,Ytr,Yte, options,stamp = 10):
     '''
     Stochastic Online AUC Maximization
     input:
-        Xtr -
+        Xtr - dense or csr
         Ytr -
-        Xte -
+        Xte - dense or csr
         Yte -
         options -
     output:
@@ -45,11 +47,14 @@ def SOLAM(Xtr,Xte,Ytr,Yte, options,stamp = 10):
     print('SOLAM with R = %.2f c = %.2f' % (R,c))
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     n, d = Xtr.shape
 
-    # initialize
+    # initialize, scalars stay Python floats
+    Ytr = np.asarray(Ytr).tolist()
     pt = 0.0
-    wt = np.zeros(d)
+    wt = ScaledVector(np.zeros(d))
+    avg = Average(wt) # weighted by step sizes
     at = 0.0
     bt = 0.0
     alphat = 0.0
@@ -59,57 +64,85 @@ def SOLAM(Xtr,Xte,Ytr,Yte, options,stamp = 10):
     balphat = 0.0
     beta = 0.0
 
-    # record auc
-    roc_auc = []
-
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-
-    for t in range(1,T+1):
-
-        xt = Xtr[t%n]
-        yt = Ytr[t%n]
-
-        # approximate prob
-        pt = ((t-1)*pt + (yt+1)//2)/t
-
-        # compute inner product
-        prod = xt @ wt
-
-        # step size
-        eta = c/sqrt(t)
-
-        # compute gradient
-        if yt == 1:
-            gradwt = 2*(1-pt)*(prod - at) - 2*(1+alphat)*(1-pt)
-            gradat = 2*(1-pt)*(at - prod)
-            gradbt = 0.0
-            gradalphat = -2*(1-pt)*prod - 2*pt*(1-pt)*alphat
-        else:
-            gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
-            gradat = 0.0
-            gradbt = 2*pt*(bt-prod)
-            gradalphat = 2 * pt * prod - 2 * pt * (1 - pt) * alphat
-        # update variable
-        wt = proj(wt - eta*gradwt*xt,R)
-        at = proj(at - eta*gradat,L/2)
-        bt = proj(bt - eta*gradbt,L/2)
-        alphat = proj(alphat + eta*gradalphat,L)
-
-        # update output
-        bwt = (beta*bwt + eta*wt)/(beta+eta)
-        bat = (beta * bat + eta * at) / (beta + eta)
-        bbt = (beta * bbt + eta * bt) / (beta + eta)
-        balphat = (beta * balphat + eta * alphat) / (beta + eta)
-        beta += eta
-
-        # write results
-        elapsed_time.append(time.time() - start_time)
-        roc_auc.append(roc_auc_score(Yte, Xte @ bwt))
-
-        # running log
-        if t % stamp == 0:
-            print('iteration: %d AUC: %.6f time eplapsed: %.2f' % (t, roc_auc[-1], elapsed_time[-1]))
-
-    return elapsed_time, roc_auc
\ No newline at end of file
+    # resume from a paused run
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        pt, wt, avg, at, bt, alphat, bat, bbt, balphat, beta = (checkpoint[key] for key in
+            ('pt', 'wt', 'avg', 'at', 'bt', 'alphat', 'bat', 'bbt', 'balphat', 'beta'))
+
+    # same iterations, compiled between evaluations
+    compiled = backend(options, Xtr) == 'numba'
+    if compiled:
+        csr = arrays(Xtr)
+        y = np.asarray(Ytr, dtype=float)
+        idx = indices(n, T)
+        state = np.array([wt.scale, wt.vv, at, bt, alphat, bat, bbt, balphat, beta, pt, avg.S])
+        solam_steps(*csr, y, idx[:0], 1, float(c), float(R), float(L), wt.v, avg.sum, avg.stamp, state) # compile off the clock
+
+    # evaluation schedule and records
+    schedule = Schedule(Xte, Yte, options, T, stamp)
+    if checkpoint:
+        schedule.restore(checkpoint['schedule'])
+
+    if compiled:
+        for start, stop in segments(schedule, schedule.t + 1, T):
+            solam_steps(*csr, y, idx[start-1:stop], start, float(c), float(R), float(L), wt.v, avg.sum, avg.stamp, state)
+            if schedule.due(stop):
+                wt.scale, avg.S, avg.weight = state[0], state[10], state[8]
+                schedule.record(stop, avg.mean(bwt))
+                if schedule.stopped:
+                    break
+        wt.scale, wt.vv, at, bt, alphat, bat, bbt, balphat, beta, pt, avg.S = state.tolist()
+        avg.weight = beta
+    else:
+        for t in range(schedule.t + 1, T + 1):
+
+            ind, xt = row(Xtr, t%n)
+            yt = Ytr[t%n]
+
+            # approximate prob
+            pt = ((t-1)*pt + (yt+1)//2)/t
+
+            # compute inner product
+            prod = wt.dot(ind, xt)
+
+            # step size
+            eta = c/sqrt(t)
+
+            # compute gradient
+            if yt == 1:
+                gradwt = 2*(1-pt)*(prod - at) - 2*(1+alphat)*(1-pt)
+                gradat = 2*(1-pt)*(at - prod)
+                gradbt = 0.0
+                gradalphat = -2*(1-pt)*prod - 2*pt*(1-pt)*alphat
+            else:
+                gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
+                gradat = 0.0
+                gradbt = 2*pt*(bt-prod)
+                gradalphat = 2 * pt * prod - 2 * pt * (1 - pt) * alphat
+            # update variable, projections of the scalars are clips
+            wt.add_row(ind, xt, -eta*gradwt, prod, float(xt @ xt))
+            wt.proj(R)
+            at = min(max(at - eta*gradat, -L/2), L/2)
+            bt = min(max(bt - eta*gradbt, -L/2), L/2)
+            alphat = min(max(alphat + eta*gradalphat, -L), L)
+
+            # update output, w lazily
+            avg.step(eta)
+            bat = (beta * bat + eta * at) / (beta + eta)
+            bbt = (beta * bbt + eta * bt) / (beta + eta)
+            balphat = (beta * balphat + eta * alphat) / (beta + eta)
+            beta += eta
+
+            # write results
+            if schedule.due(t):
+                schedule.record(t, avg.mean(bwt))
+                if schedule.stopped:
+                    break
+
+    # keep the state to resume from
+    if checkpoint is not None:
+        checkpoint.update(pt=pt, wt=wt, avg=avg, at=at, bt=bt, alphat=alphat, bat=bat, bbt=bbt, balphat=balphat,
+                          beta=beta, schedule=schedule.state())
+
+    return schedule.elapsed_time, schedule.roc_auc
@@ -5,9 +5,11 @@ Date: 4/13/19
 '''
 
 import numpy as np
-import time
-from sklearn.metrics import roc_auc_score
 from math import sqrt,fabs
+from jit import arrays, backend, indices, segments, spam_steps
+from rows import check, row, mean
+from schedule import Schedule
+from vector import Average, ScaledVector
 
 def proj(x, R):
     '''
@@ -55,9 +57,9 @@ def SPAM(Xtr,Xte,Ytr,Yte,options,stamp=10):
     '''
     Stochastic Proximal AUC Maximization
     input:
-        Xtr -
+        Xtr - dense or csr
         Ytr -
-        Xte -
+        Xte - dense or csr
         Yte -
         options -
     output:
@@ -75,62 +77,100 @@ def SPAM(Xtr,Xte,Ytr,Yte,options,stamp=10):
     print('SPAM with R = %.2f c = %.2f' % (R,c))
 
     # get the dimension of what we are working with
+    Xtr = check(Xtr)
     n, d = Xtr.shape
 
-    # initialize
-    pt = sum(Ytr[Ytr == 1]) / n
-    wt = np.zeros(d)
-    mpt = np.mean(Xtr[Ytr == 1],axis=0)
-    mnt = np.mean(Xtr[Ytr == -1],axis=0)
-
-    # restore average wt
-    avgwt = wt + 0.0
-
-    # record auc
-    roc_auc = []
-
-    # record time elapsed
-    elapsed_time = []
-    start_time = time.time()
-
-    for t in range(1,T+1):
-
-        # step size
-        eta = c/sqrt(t)
-
-        # compute inner product
-        prod = np.inner(wt, Xtr[t % n])
-
-        # compute a,b,alpha
-        at = np.inner(wt, mpt)
-        bt = np.inner(wt, mnt)
-        alphat = at - bt
-
-        # compute gradient
-        if Ytr[t%n] == 1:
-            gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt)
-        else:
-            gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
-
-        # update wt
-        wt = proj(wt - eta*gradwt*Xtr[t%n], R)
-
-        # proxima step
-        # if reg == 'l2':
-        #     wt = prox_l2(wt,lam,eta)
-        # elif reg == 'net':
-        #     wt = prox_net(wt,lam,theta,eta)
-        # else:
-        #     print('Wrong regularizer!')
-        #     return
-
-        # write results
-        elapsed_time.append(time.time() - start_time)
-        avgwt = ((t - 1) * avgwt + wt) / t
-        roc_auc.append(roc_auc_score(Yte, np.dot(Xte, avgwt)))
-
-        # running log
-        if t % stamp == 0:
-            print('iteration: %d AUC: %.6f time eplapsed: %.2f' % (t, roc_auc[-1], elapsed_time[-1]))
-
-    return elapsed_time, roc_auc
\ No newline at end of file
+    # initialize, w @ mpt and w @ mnt follow the updates of w
+    pt = float(sum(Ytr[Ytr == 1]) / n)
+    wt = ScaledVector(np.zeros(d))
+    mpt = mean(Xtr, Ytr == 1)
+    mnt = mean(Xtr, Ytr == -1)
+    kp = wt.track(mpt)
+    kn = wt.track(mnt)
+    xmp = np.asarray(Xtr @ mpt).ravel().tolist() # x @ mpt and x @ mnt of every row
+    xmn = np.asarray(Xtr @ mnt).ravel().tolist()
+    Ytr = np.asarray(Ytr).tolist()
+
+    # restore average wt, w lazily
+    avg = Average(wt)
+    avgwt = np.zeros(d)
+
+    # resume from a paused run
+    checkpoint = options.get('checkpoint')
+    if checkpoint:
+        wt, avg = checkpoint['wt'], checkpoint['avg']
+
+    # same iterations, compiled between evaluations
+    compiled = backend(options, Xtr) == 'numba'
+    if compiled:
+        csr = arrays(Xtr)
+        y = np.asarray(Ytr, dtype=float)
+        idx = indices(n, T)
+        xmp = np.array(xmp)
+        xmn = np.array(xmn)
+        state = np.array([wt.scale, wt.vv, wt.tracked[kp][1], wt.tracked[kn][1], avg.S])
+        spam_steps(*csr, y, idx[:0], 1, float(c), float(R), pt, mpt, mnt, xmp, xmn,
+                   wt.v, avg.sum, avg.stamp, state) # compile off the clock
+
+    # evaluation schedule and records
+    schedule = Schedule(Xte, Yte, options, T, stamp)
+    if checkpoint:
+        schedule.restore(checkpoint['schedule'])
+
+    if compiled:
+        for start, stop in segments(schedule, schedule.t + 1, T):
+            spam_steps(*csr, y, idx[start-1:stop], start, float(c), float(R), pt, mpt, mnt, xmp, xmn,
+                       wt.v, avg.sum, avg.stamp, state)
+            if schedule.due(stop):
+                wt.scale, avg.S, avg.weight = state[0], state[4], stop
+                schedule.record(stop, avg.mean(avgwt))
+                if schedule.stopped:
+                    break
+        wt.scale, wt.vv, wt.tracked[kp][1], wt.tracked[kn][1], avg.S = state.tolist()
+        avg.weight = float(schedule.t)
+    else:
+        for t in range(schedule.t + 1, T + 1):
+
+            # step size
+            eta = c/sqrt(t)
+
+            # compute inner product
+            ind, xt = row(Xtr, t % n)
+            prod = wt.dot(ind, xt)
+
+            # compute a,b,alpha
+            at = wt.tracked_dot(kp)
+            bt = wt.tracked_dot(kn)
+            alphat = at - bt
+
+            # compute gradient
+            if Ytr[t%n] == 1:
+                gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt)
+            else:
+                gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
+
+            # update wt
+            wt.add_row(ind, xt, -eta*gradwt, prod, float(xt @ xt), (xmp[t % n], xmn[t % n]))
+            wt.proj(R)
+
+            # proxima step
+            # if reg == 'l2':
+            #     wt = prox_l2(wt,lam,eta)
+            # elif reg == 'net':
+            #     wt = prox_net(wt,lam,theta,eta)
+            # else:
+            #     print('Wrong regularizer!')
+            #     return
+
+            # write results
+            avg.step()
+            if schedule.due(t):
+                schedule.record(t, avg.mean(avgwt))
+                if schedule.stopped:
+                    break
+
+    # keep the state to resume from
+    if checkpoint is not None:
+        checkpoint.update(wt=wt, avg=avg, schedule=schedule.state())
+
+    return schedule.elapsed_time, schedule.roc_auc
\ No newline at end of file
@@ -0,0 +1,159 @@
+'''
+AUC evaluation for +1/-1 labels
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+
+class AUC:
+    '''
+    Exact AUC on a fixed test set
+
+    The label split is computed once. Each call sorts the scores once and
+    takes the Mann-Whitney rank sum of the positives, ties get average ranks.
+    With warm start the previous ordering is reused, and since iterates change
+    little between checkpoints the stable (adaptive) sort of an almost sorted
+    array runs in close to linear time.
+    '''
+
+    def __init__(self, Y, warm = True):
+        '''
+        input:
+            Y - +1/-1 labels
+            warm - reuse the ordering of the previous call
+        '''
+
+        self.pos = np.asarray(Y) == 1
+        self.n_pos = int(np.sum(self.pos))
+        self.n_neg = len(self.pos) - self.n_pos
+        if self.n_pos == 0 or self.n_neg == 0:
+            raise ValueError('Only one class present in labels. AUC is not defined in that case.')
+
+        self.warm = warm
+        self.order = None
+
+    def __call__(self, scores):
+        '''
+        input:
+            scores - predicted scores
+        output:
+            auc - area under the roc curve
+        '''
+
+        scores = np.asarray(scores).ravel()
+
+        if self.warm and self.order is not None:
+            order = self.order[np.argsort(scores[self.order], kind='stable')]
+        else:
+            order = np.argsort(scores, kind='stable')
+        if self.warm:
+            self.order = order
+
+        s = scores[order]
+        p = self.pos[order]
+
+        # tie groups and their average 1-based ranks
+        starts = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+        counts = np.diff(np.r_[starts, len(s)])
+        ranks = starts + (counts + 1) / 2
+
+        rank_sum = np.add.reduceat(p, starts, dtype=np.int64) @ ranks
+
+        return (rank_sum - self.n_pos * (self.n_pos + 1) / 2) / (self.n_pos * self.n_neg)
+
+class SketchAUC:
+    '''
+    Approximate AUC from score histograms with bounded memory
+
+    The test set is scored chunk by chunk and only two histograms of the
+    scores (positive and negative) are kept. Pairs falling in the same bin
+    are counted as ties, so the error is at most half the fraction of
+    positive-negative pairs sharing a bin, which is reported as the bound.
+    If the bound exceeds eps the test set is scored again with finer bins
+    over the observed score range, up to passes times.
+
+    X and Y only need to support len and slicing, so h5py datasets written
+    by loader.py can be used directly.
+    '''
+
+    def __init__(self, X, Y, chunk = 65536, bins = 1024, eps = 1e-3, passes = 3):
+        '''
+        input:
+            X - testing features, array, csr matrix or h5py dataset
+            Y - +1/-1 testing labels
+            chunk - rows scored at once
+            bins - number of bins of the first pass
+            eps - target error bound
+            passes - maximum number of passes per evaluation
+        '''
+
+        self.X = X
+        self.Y = Y
+        self.n = len(Y)
+        self.chunk = chunk
+        self.bins = bins
+        self.eps = eps
+        self.passes = passes
+
+        # one pass for class sizes and the largest row norm
+        self.n_pos = 0
+        self.rmax = 0.0
+        for start in range(0, self.n, chunk):
+            x = X[start:start + chunk]
+            self.n_pos += int(np.sum(np.asarray(Y[start:start + chunk]) == 1))
+            sq = x.multiply(x).sum(axis=1) if hasattr(x, 'multiply') else np.einsum('ij,ij->i', x, x)
+            self.rmax = max(self.rmax, float(np.sqrt(np.max(sq))))
+        self.n_neg = self.n - self.n_pos
+        if self.n_pos == 0 or self.n_neg == 0:
+            raise ValueError('Only one class present in labels. AUC is not defined in that case.')
+
+        # error bound of each call
+        self.bounds = []
+
+    def __call__(self, w):
+        '''
+        input:
+            w - iterate to score
+        output:
+            auc - approximate area under the roc curve
+        '''
+
+        # scores are bounded by Cauchy-Schwarz before anything is seen
+        hi = np.linalg.norm(w) * self.rmax
+        lo = -hi
+        bins = self.bins
+
+        for k in range(self.passes):
+            if hi <= lo:
+                # all scores tie
+                auc, bound = .5, 0.0
+                break
+
+            hp = np.zeros(bins)
+            hn = np.zeros(bins)
+            smin, smax = np.inf, -np.inf
+            for start in range(0, self.n, self.chunk):
+                s = np.asarray(self.X[start:start + self.chunk] @ w).ravel()
+                p = np.asarray(self.Y[start:start + self.chunk]) == 1
+                smin = min(smin, s.min())
+                smax = max(smax, s.max())
+                idx = np.clip(((s - lo) * (bins / (hi - lo))).astype(np.int64), 0, bins - 1)
+                hp += np.bincount(idx[p], minlength=bins)
+                hn += np.bincount(idx[~p], minlength=bins)
+
+            # positives above lower bins, ties within a bin count half
+            below = np.cumsum(hn) - hn
+            pairs = self.n_pos * self.n_neg
+            auc = (hp @ below + .5 * (hp @ hn)) / pairs
+            bound = .5 * (hp @ hn) / pairs
+
+            if bound <= self.eps:
+                break
+
+            # zoom into the observed range with finer bins
+            lo, hi = smin, smax
+            bins *= 8
+
+        self.bounds.append(float(bound))
+
+        return auc
@@ -0,0 +1,265 @@
+'''
+Micro benchmarks
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import os
+import time
+import timeit
+from math import log
+import numpy as np
+import pandas as pd
+from sklearn.datasets import load_svmlight_file, make_classification
+from sklearn.metrics import roc_auc_score
+from sklearn.utils import shuffle
+from SAUC import SAUC, comb, coef, forward, shift, neg, bern_loss_func
+from auc import AUC
+from split import split
+from loader import parse
+from OPAUC import OPAUC, Sketch, FrequentDirections
+from FSAUC import FSAUC, proj_sim
+from SOLAM import SOLAM
+from SPAM import SPAM
+
+def coef_monomial(N, loss, L):
+    '''
+    Previous coefficients, in powers of L / 2 - prod
+    '''
+
+    k = np.arange(N + 1)
+    comb_dict = comb(N)
+    weight = np.exp(np.log(comb_dict[N]) - k * log(2 * L)) * (N + 1) * forward(N, loss)[:, 0]
+    return shift(N, comb_dict, weight)
+
+def neg_monomial(N, prod, L, beta):
+    '''
+    Previous negative function evaluation, expanded in powers of L / 2 - prod
+    '''
+
+    k = np.arange(N + 1)
+    exponent = np.power(L / 2 - prod, k)
+    return beta @ exponent, (beta * k)[:, 1:] @ exponent[:N]
+
+def bench_neg(N = (1, 5, 10, 25, 50, 100), name = 'hinge', R = 1, number = 10000):
+    '''
+    Compare the Bernstein basis kernel with the previous monomial one
+    input:
+        N - Bernstein degrees
+        name - loss function
+        R - radius
+        number - calls per degree
+    '''
+
+    L = 2 * R
+    loss = bern_loss_func(name, L)
+    prod = .3 * R
+
+    for m in N:
+        beta, gbeta = coef(m, loss, L, comb(m))
+        beta_ = coef_monomial(m, loss, L)
+
+        fnt, gfnt = neg(m, prod, L, beta, gbeta)
+        fnt_, gfnt_ = neg_monomial(m, prod, L, beta_)
+        error = max(np.max(np.abs(fnt - fnt_)), np.max(np.abs(gfnt - gfnt_)))
+
+        bernstein = timeit.timeit(lambda: neg(m, prod, L, beta, gbeta), number=number)
+        monomial = timeit.timeit(lambda: neg_monomial(m, prod, L, beta_), number=number)
+
+        print('neg N = %d monomial: %.2fus bernstein: %.2fus difference: %.2e'
+              % (m, monomial / number * 1e6, bernstein / number * 1e6, error))
+
+def bench_auc(X, y, folders = 3, checkpoints = 100, step = 1e-3):
+    '''
+    Compare project AUC with sklearn on the cross validation test splits
+    input:
+        X - features
+        y - labels
+        folders - number of folders as in cv.py
+        checkpoints - number of scored iterates per split
+        step - relative change of the iterate between checkpoints
+    '''
+
+    n, d = X.shape
+    rng = np.random.RandomState(7)
+
+    for folder in range(folders):
+        training, testing = split(n, folder, folders)
+        Xte = X[testing]
+        Yte = y[testing]
+
+        # slowly drifting iterates as between averaged checkpoints
+        w = rng.randn(d)
+        W = [w]
+        for k in range(checkpoints - 1):
+            w = w + step * np.linalg.norm(w) / np.sqrt(d) * rng.randn(d)
+            W.append(w)
+        S = [Xte @ w for w in W]
+
+        res = {}
+        for name, metric in [('sklearn', lambda s: roc_auc_score(Yte, s)),
+                             ('cold', AUC(Yte, warm=False)),
+                             ('warm', AUC(Yte))]:
+            start = time.time()
+            res[name] = [metric(s) for s in S]
+            res[name + '_time'] = (time.time() - start) / checkpoints
+
+        error = max(np.max(np.abs(np.array(res['sklearn']) - res[name])) for name in ['cold', 'warm'])
+        print('auc folder = %d n = %d sklearn: %.2fms cold: %.2fms warm: %.2fms error: %.2e'
+              % (folder, len(testing), res['sklearn_time'] * 1e3, res['cold_time'] * 1e3, res['warm_time'] * 1e3, error))
+
+def loader_dict(path):
+    '''
+    Previous libsvm reader through dictionaries of strings and a dataframe
+    '''
+
+    L = []
+    with open(path, 'r') as file:
+        for line in file:
+            l = line.strip().split(' ')
+            l[0] = '0:' + l[0]
+            l = filter(None, l)
+            L.append(dict(i.split(':') for i in l))
+    df = pd.DataFrame(L, dtype='float32').fillna(0)
+
+    return df.iloc[:, 1:].values, df.iloc[:, 0].values
+
+def bench_loader(path, workers = (1, 4)):
+    '''
+    Compare the libsvm parser with the previous loader and sklearn
+    input:
+        path - libsvm file
+        workers - numbers of parsing processes to try
+    '''
+
+    start = time.time()
+    X, y = load_svmlight_file(path, dtype=np.float32)
+    print('loader sklearn: %.2fs' % (time.time() - start))
+
+    start = time.time()
+    X_, y_ = loader_dict(path)
+    print('loader dict: %.2fs' % (time.time() - start))
+
+    for m in workers:
+        start = time.time()
+        Xp, yp = parse(path, n_features=X.shape[1], workers=m)
+        elapsed = time.time() - start
+        start = time.time()
+        Xd, _ = parse(path, sparse=False, n_features=X.shape[1], workers=m)
+        print('loader parse workers = %d csr: %.2fs dense: %.2fs error: %.2e labels: %s'
+              % (m, elapsed, time.time() - start, abs(X - Xp).max(), np.array_equal(y, yp)))
+
+def bench_opauc(X, y, tau = 50, T = 5000, c = 1, R = 1):
+    '''
+    Compare the frequent directions sketch with Gaussian projections in OPAUC
+    input:
+        X - dense features
+        y - labels
+        tau - sketch size
+        T - iterations
+        c - step size
+        R - radius
+    '''
+
+    n, d = X.shape
+    m = n * 2 // 3
+    pos = X[:m][y[:m] == 1]
+    w = np.random.RandomState(7).randn(d)
+
+    # covariance of the positive class against the two sketches
+    exact = (pos.T @ (pos @ w)) / len(pos) - (pos.mean(axis=0) @ w) * pos.mean(axis=0)
+
+    for sketch, engine in [('random', Sketch), ('fd', FrequentDirections)]:
+        np.random.seed(7)
+        cov = engine(d, tau)
+        for x in pos:
+            cov.update(x)
+        error = np.linalg.norm(cov.matvec(w) - exact) / np.linalg.norm(exact)
+        memory = sum(a.nbytes for a in vars(cov).values() if isinstance(a, np.ndarray))
+
+        start = time.time()
+        elapsed_time, roc_auc = OPAUC(X[:m], X[m:], y[:m], y[m:], {'T': T, 'c': c, 'R': R, 'tau': tau,
+                                                                   'sketch': sketch, 'stride': T})
+        print('opauc d = %d sketch = %s time: %.2fs memory: %.1fMB covariance error: %.2e AUC: %.4f'
+              % (d, sketch, time.time() - start, 2 * memory / 2 ** 20, error, roc_auc[-1]))
+
+def proj_sort(v, R):
+    '''
+    Previous l1 ball projection by sorting, Duchi et al.
+    '''
+
+    norm = np.linalg.norm(v, ord=1)
+    if norm <= R:
+        return v
+
+    u = np.sort(np.abs(v))[::-1]
+    sv = np.cumsum(u)
+    rho = np.nonzero(u * np.arange(1, len(v) + 1) > (sv - R))[0][-1]
+    theta = (sv[rho] - R) / (rho + 1)
+
+    return np.sign(v) * np.maximum(np.abs(v) - theta, 0)
+
+def bench_proj(D = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), number = 20):
+    '''
+    Compare the sort free l1 ball projection with the sorting one
+    input:
+        D - dimensions
+        number - calls per dimension and case
+    '''
+
+    rng = np.random.RandomState(7)
+    for d in D:
+        v = rng.randn(d)
+        norm = np.sum(np.abs(v))
+        # far outside, just outside as after one FSAUC step, and already inside
+        for case, R in [('far', norm / 10), ('near', norm * .99), ('inside', norm)]:
+            error = np.max(np.abs(proj_sim(v, R) - proj_sort(v, R)))
+            filtering = timeit.timeit(lambda: proj_sim(v, R), number=number)
+            sorting = timeit.timeit(lambda: proj_sort(v, R), number=number)
+            print('proj d = %d %s sort: %.3fms filter: %.3fms speedup: %.1fx error: %.2e'
+                  % (d, case, sorting / number * 1e3, filtering / number * 1e3, sorting / filtering, error))
+
+# solvers with a compiled kernel, their extra options and how many iterations to run
+BACKEND_SOLVERS = [('SAUC', SAUC, {'name': 'hinge', 'N': 5, 'c': 10, 'R': .1}, .01),
+                   ('SOLAM', SOLAM, {}, 1),
+                   ('SPAM', SPAM, {}, 1),
+                   ('FSAUC', FSAUC, {'delta': .1}, 1)]
+
+def bench_backend(X, y, T = 20000, stride = 1000):
+    '''
+    Time the compiled backend against the NumPy one, tests/test_parity.py checks that they agree
+    input:
+        X - dense or csr features
+        y - labels
+        T - iterations, scaled down for SAUC whose iteration t takes t steps
+        stride - iterations between evaluations
+    '''
+
+    m = X.shape[0] * 5 // 6
+    for name, solver, extra, scale in BACKEND_SOLVERS:
+        options = dict({'T': max(1, int(T * scale)), 'c': 1, 'R': 1, 'stride': max(1, int(stride * scale))}, **extra)
+        elapsed = {}
+        for backend in ['numpy', 'numba']:
+            np.random.seed(7)
+            elapsed_time, _ = solver(X[:m], X[m:], y[:m], y[m:], dict(options, backend=backend), stamp=options['T'])
+            elapsed[backend] = elapsed_time[-1]
+        print('backend %s numpy: %.2fs numba: %.2fs speedup: %.1fx'
+              % (name, elapsed['numpy'], elapsed['numba'], elapsed['numpy'] / elapsed['numba']))
+
+if __name__ == '__main__':
+
+    bench_neg()
+    bench_proj()
+
+    X, y = make_classification(12000, 200, random_state=7)
+    bench_backend(X / np.linalg.norm(X, axis=1)[:, None], 2 * y - 1)
+
+    for d in [1000, 4000]:
+        X, y = make_classification(6000, d, n_informative=50, random_state=7)
+        bench_opauc(X / np.linalg.norm(X, axis=1)[:, None], 2 * y - 1)
+
+    dataset = 'cod-rna'
+    if os.path.isfile('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset)):
+        X, y = load_svmlight_file('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset), dtype = np.float32)
+        X, y = shuffle(X, y, random_state=7)
+        bench_auc(X, y)
+        bench_loader('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset))
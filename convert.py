@@ -7,9 +7,86 @@ Date : 5/5/19
 
 from sklearn.datasets import load_svmlight_file, dump_svmlight_file
 from sklearn import preprocessing
+from scipy.sparse import csr_matrix, issparse
 import numpy as np
+import json
 import os
 
+def dump_binary(X, y, path, normalization = 'none'):
+    '''
+    Write a dataset as memory mappable .npy files
+    input:
+        X - dense array or sparse matrix
+        y - +1 -1 labels
+        path - directory to write, created if missing
+        normalization - preprocessing already applied, kept in the header
+    '''
+
+    os.makedirs(path, exist_ok=True)
+
+    if issparse(X):
+        X = csr_matrix(X, dtype=np.float32)
+        X.sum_duplicates()  # loaded matrices are read only, keep them canonical
+        index = np.int32 if X.nnz < 2 ** 31 else np.int64
+        arrays = {'data': X.data, 'indices': X.indices.astype(index), 'indptr': X.indptr.astype(index)}
+    else:
+        arrays = {'X': np.ascontiguousarray(X, dtype=np.float32)}
+    arrays['y'] = np.asarray(y, dtype=np.float32)
+
+    for key, a in arrays.items():
+        np.save(os.path.join(path, key + '.npy'), a)
+
+    n_pos = int(np.sum(arrays['y'] == 1))
+    meta = {'n': X.shape[0], 'd': X.shape[1], 'sparse': issparse(X), 'n_pos': n_pos,
+            'n_neg': X.shape[0] - n_pos, 'normalization': normalization}
+
+    # header last, a directory without it is an unfinished conversion
+    with open(os.path.join(path, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+
+def load_binary(path, mmap_mode = 'r'):
+    '''
+    Map a dataset written by dump_binary
+    input:
+        path - directory written by dump_binary
+        mmap_mode - np.load mode, 'r' shares read only pages between processes
+    output:
+        X - float32 features, csr matrix or dense array
+        y - labels
+        meta - header with n, d, n_pos, n_neg and normalization
+    '''
+
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+
+    load = lambda key: np.load(os.path.join(path, key + '.npy'), mmap_mode=mmap_mode)
+    if meta['sparse']:
+        X = csr_matrix((load('data'), load('indices'), load('indptr')), shape=(meta['n'], meta['d']), copy=False)
+        X.has_sorted_indices = True
+        X.has_canonical_format = True
+    else:
+        X = load('X')
+
+    return X, load('y'), meta
+
+def load(dataset, dtype = np.float64):
+    '''
+    Load a converted dataset, from the binary copy when there is one
+    input:
+        dataset - dataset name
+        dtype - feature type when falling back to the libsvm text
+    output:
+        X - features
+        y - labels
+    '''
+
+    path = '/home/neyo/PycharmProjects/AUC/npy-datasets/%s' % (dataset)
+    if os.path.isfile(os.path.join(path, 'meta.json')):
+        X, y, meta = load_binary(path)
+        return X, y
+
+    return load_svmlight_file('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset), dtype = dtype)
+
 if __name__ == '__main__':
 
     datasets = ['webspam_u']
@@ -33,7 +110,8 @@ if __name__ == '__main__':
 
             print('Done! Dumping into file......', end=' ')
             dump_svmlight_file(X, y, '/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset), zero_based=False)
+            dump_binary(X, y, '/home/neyo/PycharmProjects/AUC/npy-datasets/%s' % (dataset), normalization = 'l2')
             print('Done!')
 
         else:
-            pass
\ No newline at end of file
+            pass
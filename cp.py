@@ -6,7 +6,6 @@ Author: Zhenhuan(Neyo) Yang
 import h5py
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.datasets import load_svmlight_file
 from sklearn import preprocessing
 from sklearn.model_selection import train_test_split
 from SOLAM import SOLAM
@@ -15,6 +14,7 @@ from SPAM import SPAM
 from OAM import OAM
 from OPAUC import OPAUC
 from FSAUC import FSAUC
+from convert import load
 
 if __name__ == '__main__':
 
@@ -41,8 +41,7 @@ if __name__ == '__main__':
     print('Loading dataset = %s ......' %(dataset), end=' ')
 
 
-    X, y = load_svmlight_file('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' %dataset)
-    X = X.toarray()
+    X, y = load(dataset)
     # Simple prepare training and testing
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.33, random_state=7)
 
@@ -8,9 +8,7 @@ import numpy as np
 import multiprocessing as mp
 from itertools import product
 import pandas as pd
-from sklearn.datasets import load_svmlight_file
 from sklearn import preprocessing
-from sklearn.utils import shuffle
 import h5py
 import matplotlib.pyplot as plt
 from SAUC import SAUC
@@ -20,6 +18,25 @@ from OPAUC import OPAUC
 from SOLAM import SOLAM
 from FSAUC import FSAUC
 from split import split
+from rows import Subset
+from shared import share, attach
+from convert import load
+
+def init(spec, labels, opts):
+
+    '''
+    Attach the shared dataset once per worker
+
+    input:
+        spec - shared memory description
+        labels -
+        opts - options
+    '''
+
+    global blocks, X, y, options
+    blocks, X = attach(spec)
+    y = labels
+    options = opts
 
 def single_run(para):
 
@@ -34,19 +51,29 @@ def single_run(para):
     '''
 
     # unfold parameters
-    folder, alg, trte,c,r = para
+    folder, alg, trte, c, r, checkpoint, until = para
     training, testing = trte
 
-    # FEATURES and LABELS must be global here to avoid multiprocessing sharing
-    Xtr = X[training]
+    # zero-copy views of the shared FEATURES, only LABELS are copied
+    Xtr = Subset(X, training)
     Ytr = y[training]
-    Xte = X[testing]
+    Xte = Subset(X, testing)
     Yte = y[testing]
 
     # Define model parameter
     options['c'] = c
     options['R'] = r
 
+    # pause at until and keep the state in checkpoint to resume from, if given
+    options['checkpoint'] = checkpoint
+    options['until'] = until
+
+    # a fresh run samples the same on a folder whichever worker runs it, so
+    # the (c, R) of grid and halving search are compared on the same draws,
+    # a resumed run restores its state from the checkpoint
+    if not checkpoint:
+        np.random.seed(folder)
+
     # implement algorithm
     if alg =='SAUC':
         elapsed_time, roc_auc = SAUC(Xtr, Xte, Ytr, Yte, options)
@@ -65,7 +92,7 @@ def single_run(para):
         elapsed_time = []
         roc_auc = []
 
-    return folder,c,r,roc_auc
+    return folder,c,r,roc_auc,checkpoint
 
 
 def cv(alg, n, folders, num_cpus, C, R):
@@ -82,30 +109,123 @@ def cv(alg, n, folders, num_cpus, C, R):
         R -
     '''
 
-    # record auc
-    ROC_AUC = pd.DataFrame()
-
     # record parameters
     input_paras = []
 
     # cross validation prepare
     for folder in range(folders):
         training, testing = split(n, folder, folders)
-        trte = training, testing
+        trte = np.array(training), np.array(testing)
         for c,r in product(C,R):
-            input_paras.append((folder,alg,trte,c,r))
+            input_paras.append((folder,alg,trte,c,r,None,None))
+
+    # place the dataset in shared memory once for all workers
+    blocks, spec = share(X)
+
+    # cross validation run on multiprocessors, the shared memory is freed even if a run fails
+    try:
+        with mp.Pool(processes=num_cpus, initializer=init, initargs=(spec, y, options)) as pool:
+            results_pool = pool.map(single_run, input_paras)
+            pool.close()
+            pool.join()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # record auc, stopped runs are shorter and padded with NaN
+    ROC_AUC = pd.DataFrame({(folder,c,r): pd.Series(roc_auc, dtype=float)
+                            for folder, c, r, roc_auc, _ in results_pool})
 
-    # cross validation run on multiprocessors
-    with mp.Pool(processes=num_cpus) as pool:
-        results_pool = pool.map(single_run, input_paras)
-        pool.close()
-        pool.join()
+    return ROC_AUC
 
-    # get results
-    for folder, c, r, roc_auc in results_pool:
-        ROC_AUC[(folder,c,r)] = roc_auc
+def halving(alg, n, folders, num_cpus, C, R, eta = 3, rungs = 3, min_budget = None):
 
-    return ROC_AUC
+    '''
+    Cross validation by successive halving
+
+    Every (c, R) runs on every folder for T / eta ** (rungs - 1) iterations,
+    the best 1 / eta of them by mean folder AUC go on for eta times as many,
+    resumed from their checkpoints, until the last ones reach T. Runs that
+    stopped early for good are not resumed. No configuration is dropped
+    before min_budget iterations, the rungs below it are left out instead,
+    a min_budget of T is a plain grid search.
+
+    input:
+        alg - algorithm
+        n - number of samples
+        folders - number of folders
+        num_cpus -
+        C -
+        R -
+        eta - ratio of budgets and of survivors between rungs
+        rungs - largest number of rungs
+        min_budget - fewest iterations of the first rung, options['min_iter']
+                     of the early stopping or T / eta if not given
+    output:
+        ROC_AUC - as cv, dropped configurations have shorter records
+        budget - last iteration each (c, R) was run to, its AUC is not comparable
+                 to that of configurations run further
+    '''
+
+    T = options['T']
+    if min_budget is None:
+        min_budget = options.get('min_iter', T // eta)
+    budgets = [T // eta ** k for k in reversed(range(rungs)) if T // eta ** k >= max(1, min_budget)] or [T]
+    rungs = len(budgets)
+
+    # cross validation prepare
+    trte = [tuple(np.array(idx) for idx in split(n, folder, folders)) for folder in range(folders)]
+    configs = list(product(C, R))
+    records = {}
+    checkpoints = {(folder,c,r): {} for folder in range(folders) for c,r in configs}
+    budget = {}
+
+    # place the dataset in shared memory once for all workers
+    blocks, spec = share(X)
+
+    # the shared memory is freed even if a run fails
+    try:
+        with mp.Pool(processes=num_cpus, initializer=init, initargs=(spec, y, options)) as pool:
+            for i, until in enumerate(budgets):
+
+                # start or resume the paused runs of the surviving configurations
+                input_paras = []
+                for c,r in configs:
+                    for folder in range(folders):
+                        checkpoint = checkpoints[(folder,c,r)]
+                        if checkpoint is not None and (not checkpoint or checkpoint['schedule']['stopped'] == 'paused'):
+                            input_paras.append((folder,alg,trte[folder],c,r,checkpoint,until))
+                for folder, c, r, roc_auc, checkpoint in pool.map(single_run, input_paras):
+                    records[(folder,c,r)] = roc_auc
+                    checkpoints[(folder,c,r)] = checkpoint
+                for c,r in configs:
+                    budget[(c,r)] = until
+
+                print('rung %d: %d configurations up to iteration %d' % (i, len(configs), until))
+
+                # keep the best by mean folder AUC so far, diverged runs count as 0,
+                # and free the states of the dropped ones
+                if i < rungs - 1:
+                    score = {(c,r): np.mean([max(records[(folder,c,r)], default=0.0) for folder in range(folders)])
+                             for c,r in configs}
+                    kept = sorted(configs, key=lambda k: score[k], reverse=True)[:max(1, len(configs) // eta)]
+                    for c,r in set(configs) - set(kept):
+                        for folder in range(folders):
+                            checkpoints[(folder,c,r)] = None
+                    configs = kept
+
+            pool.close()
+            pool.join()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    # record auc, stopped runs are shorter and padded with NaN
+    ROC_AUC = pd.DataFrame({key: pd.Series(roc_auc, dtype=float) for key, roc_auc in records.items()})
+
+    return ROC_AUC, budget
 
 
 if __name__ == '__main__':
@@ -119,12 +239,24 @@ if __name__ == '__main__':
     # Define hyper parameters
     options = {}
     options['name'] = 'hinge'
+    options['cache'] = '/home/neyo/PycharmProjects/AUC/cache'
     options['T'] = 10
     options['N'] = 10
     options['delta'] = .1
     options['option'] = 'gradient'
     options['sampling'] = 'reservoir'
 
+    # stop converged configurations early, only on a sparse evaluation schedule
+    # as patience and tol count evaluations, diverged runs always stop
+    # options['eval'] = 'geometric'
+    # options['min_iter'] = 1000
+    # options['patience'] = 5
+    # options['tol'] = 1e-3
+
+    # 'grid' runs every configuration to T, 'halving' drops the worse ones
+    # after T / 3 iterations, or options['min_iter'] if set
+    search = 'halving'
+
     # Define model parameter
     options['Np'] = 100
     options['Nn'] = 100
@@ -138,16 +270,20 @@ if __name__ == '__main__':
 
     for dataset in datasets:
 
-        X, y = load_svmlight_file('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset), dtype = np.float32)
-
-        X = X.toarray()
+        X, y = load(dataset, dtype = np.float32)
 
-        X, y = shuffle(X, y, random_state= 7)
+        # shuffle through a permutation index, the loaded features are not copied
+        order = np.random.RandomState(7).permutation(len(y))
+        X, y = Subset(X, order), y[order]
 
         m = len(y)
 
         for alg in algs:
-            ROC_AUC = cv(alg, m, folders, num_cpus, C, R)
+            if search == 'halving':
+                ROC_AUC, budget = halving(alg, m, folders, num_cpus, C, R)
+            else:
+                ROC_AUC = cv(alg, m, folders, num_cpus, C, R)
+                budget = {(c, r): options['T'] for c, r in product(C, R)}
             result = {}
             # Results
             for c, r in product(C, R):
@@ -156,12 +292,12 @@ if __name__ == '__main__':
                 do = []
                 for folder in range(folders):
                     result[(c,r)][folder] = ROC_AUC[(folder, c, r)]
-                    do.append(max(result[c,r][folder]))
+                    do.append(np.nanmax(result[c,r][folder]))
 
                 MEAN = np.mean(do)
                 STD = np.std(do)
 
-                print('alg = %s data = %s c = %.2f R = %.2f AUC = ' % (alg, dataset, c, r), end=' ')
+                print('alg = %s data = %s c = %.2f R = %.2f T = %d AUC = ' % (alg, dataset, c, r, budget[(c, r)]), end=' ')
                 print(('%.4f$\pm$' % MEAN).lstrip('0'), end='')
                 print(('%.4f' % STD).lstrip('0'))
 
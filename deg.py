@@ -8,11 +8,28 @@ import matplotlib.pyplot as plt
 import numpy as np
 import multiprocessing as mp
 import pandas as pd
-from sklearn.datasets import load_svmlight_file
 from sklearn import preprocessing
-from sklearn.utils import shuffle
 from SAUC import SAUC
 from split import split
+from rows import Subset
+from shared import share, attach
+from convert import load
+
+def init(spec, labels, opts):
+
+    '''
+    Attach the shared dataset once per worker
+
+    input:
+        spec - shared memory description
+        labels -
+        opts - options
+    '''
+
+    global blocks, X, y, options
+    blocks, X = attach(spec)
+    y = labels
+    options = opts
 
 def single_run(para):
 
@@ -27,10 +44,10 @@ def single_run(para):
     folder, trte, m = para
     training, testing = trte
 
-    # FEATURES and LABELS must be global here to avoid multiprocessing sharing
-    Xtr = X[training]
+    # zero-copy views of the shared FEATURES, only LABELS are copied
+    Xtr = Subset(X, training)
     Ytr = y[training]
-    Xte = X[testing]
+    Xte = Subset(X, testing)
     Yte = y[testing]
 
     # Define model parameter
@@ -62,15 +79,23 @@ def cv(n, folders, num_cpus, N):
     # cross validation prepare
     for folder in range(folders):
         training, testing = split(n, folder, folders)
-        trte = training, testing
+        trte = np.array(training), np.array(testing)
         for m in N:
             input_paras.append((folder,trte,m))
 
-    # cross validation run on multiprocessors
-    with mp.Pool(processes=num_cpus) as pool:
-        results_pool = pool.map(single_run, input_paras)
-        pool.close()
-        pool.join()
+    # place the dataset in shared memory once for all workers
+    blocks, spec = share(X)
+
+    # cross validation run on multiprocessors, the shared memory is freed even if a run fails
+    try:
+        with mp.Pool(processes=num_cpus, initializer=init, initargs=(spec, y, options)) as pool:
+            results_pool = pool.map(single_run, input_paras)
+            pool.close()
+            pool.join()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
 
     # get results
     for folder, m, roc_auc in results_pool:
@@ -88,6 +113,7 @@ if __name__ == '__main__':
     # Define hyper parameters
     options = {}
     options['name'] = 'hinge'
+    options['cache'] = '/home/neyo/PycharmProjects/AUC/cache'
     options['T'] = 100
 
     # Define model parameter
@@ -99,11 +125,11 @@ if __name__ == '__main__':
 
     for dataset in datasets:
 
-        X, y = load_svmlight_file('/home/neyo/PycharmProjects/AUC/bi-datasets/%s' % (dataset))
-
-        X = X.toarray()
+        X, y = load(dataset)
 
-        X, y = shuffle(X, y, random_state=7)
+        # shuffle through a permutation index, the loaded features are not copied
+        order = np.random.RandomState(7).permutation(len(y))
+        X, y = Subset(X, order), y[order]
 
         n = len(y)
 
@@ -0,0 +1,628 @@
+'''
+Optional compiled inner loops
+Author: Zhenhuan(Neyo) Yang
+
+Solvers whose steps are scalar work over one row (SAUC, SOLAM, SPAM, FSAUC)
+run their iterations between two evaluations in one compiled call when
+options['backend'] is 'numba'. The kernels follow the NumPy code operation
+by operation, iterates agree up to rounding in the order of summation, see
+tests/test_parity.py. Rows of a Subset are read from the array or csr matrix
+behind it. Without Numba, for other row sources, for SAUC with a batch_size
+above 1 and for OAM and OPAUC, whose steps are already matrix work, the NumPy
+code runs and says so.
+'''
+
+import numpy as np
+from math import sqrt
+from scipy.sparse import issparse
+from get_idx import get_idx
+from rows import Subset
+
+try:
+    from numba import njit
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+def backend(options, X):
+    '''
+    Backend to run a solver on
+    input:
+        options - solver options, 'backend' is 'numpy' (default) or 'numba'
+        X - training features after rows.check
+    output:
+        backend - 'numba' or 'numpy'
+    '''
+
+    if options.get('backend', 'numpy') != 'numba':
+        return 'numpy'
+    if not NUMBA:
+        print('Numba not available, using NumPy backend!')
+        return 'numpy'
+    if isinstance(X, Subset):
+        X = X.X
+    if not (issparse(X) or isinstance(X, np.ndarray)):
+        print('Numba backend needs a dense array, csr matrix or Subset of them, using NumPy backend!')
+        return 'numpy'
+    return 'numba'
+
+def arrays(X):
+    '''
+    Rows of X as csr arrays, dense rows are indexed through indptr alone
+    input:
+        X - dense array, csr matrix or Subset of them
+    output:
+        indptr, indices, data - csr arrays of X or of the rows behind a Subset,
+            indices is empty for dense rows
+        dense - whether the rows are dense
+        rows - row of the arrays holding row i of X
+    '''
+
+    if isinstance(X, Subset):
+        indptr, indices, data, dense, _ = arrays(X.X)
+        return indptr, indices, data, dense, np.asarray(X.idx, dtype=np.int64)
+
+    n, d = X.shape
+    rows = np.arange(n, dtype=np.int64)
+    if issparse(X):
+        return X.indptr, X.indices, X.data, False, rows
+
+    data = np.ascontiguousarray(X).ravel()
+    return np.arange(n + 1, dtype=np.int64) * d, np.zeros(0, dtype=np.int32), data, True, rows
+
+def indices(n, T):
+    '''
+    Rows visited at iterations 1, ..., T, as t % n in the NumPy code
+    '''
+
+    return get_idx(n, T // n + 1)[1:T + 1]
+
+def segments(schedule, start, stop, steps = 1024):
+    '''
+    Split iterations start, ..., stop into runs ending where an evaluation may be due
+    input:
+        schedule - Schedule of the solver
+        start - first iteration
+        stop - last iteration
+        steps - iterations between clock checks in 'time' mode
+    output:
+        pairs (a, b) of first and last iteration of each run
+    '''
+
+    t = start - 1
+    while t < stop:
+        b = min(schedule.upcoming(t, steps), stop)
+        yield t + 1, b
+        t = b
+
+@njit(cache=True)
+def _dot(v, indptr, indices, data, dense, i):
+    '''
+    v @ x and x @ x for row i
+    '''
+
+    prod = 0.0
+    sq = 0.0
+    start = indptr[i]
+    for p in range(start, indptr[i + 1]):
+        j = p - start if dense else indices[p]
+        prod += v[j] * data[p]
+        sq += data[p] * data[p]
+    return prod, sq
+
+@njit(cache=True)
+def _add(v, a, indptr, indices, data, dense, i):
+    '''
+    v += a * x for row i
+    '''
+
+    start = indptr[i]
+    for p in range(start, indptr[i + 1]):
+        j = p - start if dense else indices[p]
+        v[j] += a * data[p]
+
+@njit(cache=True)
+def _touch(v, S, total, stamp, indptr, indices, dense, i):
+    '''
+    vector.Average.touch for the entries of row i
+    '''
+
+    start = indptr[i]
+    for p in range(start, indptr[i + 1]):
+        j = p - start if dense else indices[p]
+        total[j] += v[j] * (S - stamp[j])
+        stamp[j] = S
+
+@njit(cache=True)
+def _flush(v, S, total, stamp):
+    '''
+    vector.Average.flush
+    '''
+
+    for j in range(len(v)):
+        total[j] += v[j] * (S - stamp[j])
+        stamp[j] = 0.0
+
+@njit(cache=True)
+def solam_steps(indptr, indices, data, dense, rows, y, idx, t0, c, R, L, v, total, stamp, state):
+    '''
+    SOLAM iterations t0, ..., t0 + len(idx) - 1
+    input:
+        indptr, indices, data, dense, rows - training rows from arrays
+        y - float labels
+        idx - rows of the iterations
+        t0 - first iteration
+        c, R, L - SOLAM parameters
+        v - w = scale * v, updated in place
+        total, stamp - vector.Average of w weighted by step sizes, updated in place
+        state - scale, v @ v, a, b, alpha, averages of a, b, alpha, weight, p, clock S of the average
+    '''
+
+    scale, vv, at, bt, alphat, bat, bbt, balphat, beta, pt, S = state
+
+    for k in range(len(idx)):
+        t = t0 + k
+        i = idx[k]
+        yt = y[i]
+
+        # approximate prob
+        pt = ((t - 1) * pt + (yt + 1) // 2) / t
+
+        # compute inner product
+        prod, sq = _dot(v, indptr, indices, data, dense, rows[i])
+        prod *= scale
+
+        # step size
+        eta = c / sqrt(t)
+
+        # compute gradient
+        if yt == 1:
+            gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt)
+            gradat = 2 * (1 - pt) * (at - prod)
+            gradbt = 0.0
+            gradalphat = -2 * (1 - pt) * prod - 2 * pt * (1 - pt) * alphat
+        else:
+            gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
+            gradat = 0.0
+            gradbt = 2 * pt * (bt - prod)
+            gradalphat = 2 * pt * prod - 2 * pt * (1 - pt) * alphat
+
+        # update variable as ScaledVector.add_row and proj
+        a = -eta * gradwt / scale
+        vv += 2 * a * prod / scale + a * a * sq
+        _touch(v, S, total, stamp, indptr, indices, dense, rows[i])
+        _add(v, a, indptr, indices, data, dense, rows[i])
+        norm = sqrt(max(scale * scale * vv, 0.0))
+        if norm > R:
+            scale *= R / norm
+            if abs(scale) < 1e-8:
+                _flush(v, S, total, stamp)
+                S = 0.0
+                v *= scale
+                scale = 1.0
+                vv = v @ v
+        at = min(max(at - eta * gradat, -L / 2), L / 2)
+        bt = min(max(bt - eta * gradbt, -L / 2), L / 2)
+        alphat = min(max(alphat + eta * gradalphat, -L), L)
+
+        # update output, w lazily
+        S += eta * scale
+        bat = (beta * bat + eta * at) / (beta + eta)
+        bbt = (beta * bbt + eta * bt) / (beta + eta)
+        balphat = (beta * balphat + eta * alphat) / (beta + eta)
+        beta += eta
+
+    state[:] = (scale, vv, at, bt, alphat, bat, bbt, balphat, beta, pt, S)
+
+@njit(cache=True)
+def spam_steps(indptr, indices, data, dense, rows, y, idx, t0, c, R, pt, mpt, mnt, xmp, xmn, v, total, stamp, state):
+    '''
+    SPAM iterations t0, ..., t0 + len(idx) - 1
+    input:
+        indptr, indices, data, dense, rows - training rows from arrays
+        y - float labels
+        idx - rows of the iterations
+        t0 - first iteration
+        c, R, pt - SPAM parameters
+        mpt, mnt - class means
+        xmp, xmn - products of every row with the class means
+        v - w = scale * v, updated in place
+        total, stamp - vector.Average of w, updated in place
+        state - scale, v @ v, v @ mpt, v @ mnt, clock S of the average
+    '''
+
+    scale, vv, vmp, vmn, S = state
+
+    for k in range(len(idx)):
+        t = t0 + k
+        i = idx[k]
+
+        # step size
+        eta = c / sqrt(t)
+
+        # compute inner product
+        prod, sq = _dot(v, indptr, indices, data, dense, rows[i])
+        prod *= scale
+
+        # compute a,b,alpha
+        at = scale * vmp
+        bt = scale * vmn
+        alphat = at - bt
+
+        # compute gradient
+        if y[i] == 1:
+            gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt)
+        else:
+            gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
+
+        # update wt as ScaledVector.add_row and proj
+        a = -eta * gradwt / scale
+        vv += 2 * a * prod / scale + a * a * sq
+        vmp += a * xmp[i]
+        vmn += a * xmn[i]
+        _touch(v, S, total, stamp, indptr, indices, dense, rows[i])
+        _add(v, a, indptr, indices, data, dense, rows[i])
+        norm = sqrt(max(scale * scale * vv, 0.0))
+        if norm > R:
+            scale *= R / norm
+            if abs(scale) < 1e-8:
+                _flush(v, S, total, stamp)
+                S = 0.0
+                v *= scale
+                scale = 1.0
+                vv = v @ v
+                vmp = v @ mpt
+                vmn = v @ mnt
+
+        # write results, w lazily
+        S += scale
+
+    state[:] = (scale, vv, vmp, vmn, S)
+
+@njit(cache=True)
+def _proj_ball(x, R):
+    '''
+    SAUC.proj in place
+    '''
+
+    sq = 0.0
+    for k in range(len(x)):
+        sq += x[k] * x[k]
+    norm = sqrt(sq)
+    if norm > R:
+        for k in range(len(x)):
+            x[k] = x[k] / norm * R
+
+@njit(cache=True)
+def sauc_steps(indptr, indices, data, dense, rows, y, t0, t1, c, R, L, gamma, R1, R2, beta, gbeta,
+               WT, AT, BT, ALPHAT, avgwt):
+    '''
+    SAUC outer iterations t0, ..., t1 with batch_size 1
+    input:
+        indptr, indices, data, dense, rows - training rows from arrays
+        y - float labels
+        t0, t1 - first and last outer iteration
+        c, R, L, gamma, R1, R2 - SAUC parameters
+        beta, gbeta - Bernstein coefficient matrices
+        WT, AT, BT, ALPHAT - outer variables, updated in place
+        avgwt - average of WT, updated in place
+    '''
+
+    n = len(rows)
+    d = len(WT)
+    N = len(AT) - 1
+    K = 2 * (N + 1)
+
+    # wj = scale * v + offset * u anchored at u = WT, and its vector.Average
+    u = np.empty(d)
+    v = np.empty(d)
+    total = np.empty(d)
+    stamp = np.empty(d)
+
+    # inner variables and their sums, Bernstein terms of one product
+    aj = np.empty(N + 1)
+    bj = np.empty(N + 1)
+    alphaj = np.empty(N + 1)
+    BAt = np.empty(N + 1)
+    BBt = np.empty(N + 1)
+    BALPHAt = np.empty(N + 1)
+    fpt = np.empty(N + 1)
+    gfpt = np.empty(N + 1)
+    fnt = np.empty(N + 1)
+    gfnt = np.empty(N + 1)
+    exponent = np.empty(N + 1)
+
+    for t in range(t0, t1 + 1):
+        # initialize inner loop variables, wj anchored at WT
+        u[:] = WT
+        v[:] = WT
+        scale = 1.0
+        offset = 0.0
+        vv = v @ v
+        uu = u @ u
+        vu = v @ u
+        total[:] = 0.0
+        stamp[:] = 0.0
+        S = 0.0
+        O = 0.0
+        weight = 0.0
+        aj[:] = AT
+        bj[:] = BT
+        alphaj[:] = ALPHAT
+        BAt[:] = 0.0
+        BBt[:] = 0.0
+        BALPHAt[:] = 0.0
+
+        # step size
+        eta = c / sqrt(t) / gamma
+
+        for j in range(t):
+            i = (t * (t - 1) // 2 + j) % n
+            start = indptr[rows[i]]
+            stop = indptr[rows[i] + 1]
+
+            # inner product as ScaledVector.dot
+            pv = 0.0
+            pu = 0.0
+            for p in range(start, stop):
+                q = p - start if dense else indices[p]
+                pv += v[q] * data[p]
+                pu += u[q] * data[p]
+            prod = scale * pv
+            if offset != 0.0:
+                prod += offset * pu
+
+            # pos and neg, neg in the Bernstein basis as SAUC.neg
+            plus = L / 2 + prod
+            z = (L / 2 - prod) / (2 * L)
+            ratio = z / (1 - z)
+            for k in range(N + 1):
+                fpt[k] = plus ** float(k)
+                gfpt[k] = fpt[k] * k / plus
+                exponent[k] = ratio ** float(k)
+            for k in range(N + 1):
+                f = 0.0
+                for m in range(N + 1):
+                    f += exponent[m] * beta[k, m]
+                g = 0.0
+                for m in range(N):
+                    g += exponent[m] * gbeta[k, m]
+                fnt[k] = f * (1 - z) ** float(N - k)
+                gfnt[k] = g * (1 - z) ** float(N - k - 1)
+
+            # gradient of w, then a, b and alpha from their old values
+            gradwt = 0.0
+            if y[i] == 1:
+                for k in range(N + 1):
+                    gradwt += 2 * (alphaj[k] - aj[k]) * gfpt[k]
+                for k in range(N + 1):
+                    aj[k] = aj[k] - eta * (2 * (aj[k] - fpt[k])) / K
+                    bj[k] = bj[k] - eta * (2 * bj[k]) / K
+                    alphaj[k] = alphaj[k] + eta * (-2 * (alphaj[k] - fpt[k])) / K
+            else:
+                for k in range(N + 1):
+                    gradwt += 2 * (alphaj[k] - bj[k]) * gfnt[k]
+                for k in range(N + 1):
+                    aj[k] = aj[k] - eta * (2 * aj[k]) / K
+                    bj[k] = bj[k] - eta * (2 * (bj[k] - fnt[k])) / K
+                    alphaj[k] = alphaj[k] + eta * (-2 * (alphaj[k] - fnt[k])) / K
+
+            # shrink towards WT as ScaledVector.mix
+            a = 1 - eta * gamma
+            scale *= a
+            offset = a * offset + eta * gamma
+            if abs(scale) < 1e-8:
+                _flush(v, S, total, stamp)
+                S = 0.0
+                v *= scale
+                scale = 1.0
+                vv = v @ v
+                vu = v @ u
+
+            # add the row as ScaledVector.add, catching up the average first
+            a = -eta * gradwt * y[i]
+            old = 0.0
+            sq = 0.0
+            dvu = 0.0
+            for p in range(start, stop):
+                q = p - start if dense else indices[p]
+                dv = a * data[p] / K / scale
+                old += v[q] * dv
+                sq += dv * dv
+                dvu += dv * u[q]
+                total[q] += v[q] * (S - stamp[q])
+                stamp[q] = S
+                v[q] += dv
+            vv += 2 * old + sq
+            vu += dvu
+
+            # projections as ScaledVector.proj and proj
+            norm = sqrt(max(scale * scale * vv + 2 * scale * offset * vu + offset * offset * uu, 0.0))
+            if norm > R:
+                scale *= R / norm
+                offset *= R / norm
+                if abs(scale) < 1e-8:
+                    _flush(v, S, total, stamp)
+                    S = 0.0
+                    v *= scale
+                    scale = 1.0
+                    vv = v @ v
+                    vu = v @ u
+            _proj_ball(aj, R1)
+            _proj_ball(bj, R2)
+            _proj_ball(alphaj, R1 + R2)
+
+            # running sums, w lazily
+            S += scale
+            O += offset
+            weight += 1.0
+            for k in range(N + 1):
+                BAt[k] += aj[k]
+                BBt[k] += bj[k]
+                BALPHAt[k] += alphaj[k]
+
+        # update outer loop variables, WT as vector.Average.mean
+        for q in range(d):
+            WT[q] = ((S - stamp[q]) * v[q] + total[q] + O * u[q]) / weight
+            avgwt[q] = (avgwt[q] * (t - 1) + WT[q]) / t
+        for k in range(N + 1):
+            AT[k] = BAt[k] / t
+            BT[k] = BBt[k] / t
+            ALPHAT[k] = BALPHAt[k] / t
+
+@njit(cache=True)
+def _proj_sim(w, R, u):
+    '''
+    FSAUC.proj_sim in place, u is scratch of the size of w
+
+    Condat's online pass over |w| gives a lower bound of the threshold,
+    (sum(U) - R) / |U| of a running set U, in the same pass as the norm, so
+    Michelot's filtering starts from few entries, expected O(d) overall.
+    '''
+
+    d = len(w)
+    norm = 0.0
+    rho = abs(w[0]) - R
+    size = 1
+    for j in range(d):
+        u[j] = abs(w[j])
+        norm += u[j]
+        if j > 0 and u[j] > rho:
+            rho += (u[j] - rho) / (size + 1)
+            if rho > u[j] - R:
+                size += 1
+            else:
+                rho = u[j] - R
+                size = 1
+    if norm <= R or not np.isfinite(norm):
+        return
+
+    # Michelot's filtering, kept entries move to the front of u
+    L = d
+    theta = max((norm - R) / L, rho)
+    while True:
+        m = 0
+        s = 0.0
+        for j in range(L):
+            if u[j] > theta:
+                u[m] = u[j]
+                s += u[j]
+                m += 1
+        L = m
+        if L == 0:
+            break
+        temp = (s - R) / L
+        if temp <= theta:
+            break
+        theta = temp
+
+    for j in range(d):
+        w[j] = np.copysign(max(abs(w[j]) - theta, 0.0), w[j])
+
+@njit(cache=True)
+def _proj_l2(v, o, R, tmp):
+    '''
+    FSAUC.proj_l2 in place
+    '''
+
+    sq = 0.0
+    for j in range(len(v)):
+        tmp[j] = v[j] - o[j]
+        sq += tmp[j] * tmp[j]
+    norm = sqrt(sq)
+    if norm > R:
+        scale = R / norm
+        for j in range(len(v)):
+            v[j] = tmp[j] * scale + o[j]
+
+@njit(cache=True)
+def fsauc_steps(indptr, indices, data, dense, rows, y, idx, t0, eta, r, R, kappa, D, ALPHAt,
+                v, Vt, VT, Ap, Am, tmp, u, state):
+    '''
+    FSAUC iterations t0, ..., t0 + len(idx) - 1 of one stage
+    input:
+        indptr, indices, data, dense, rows - training rows from arrays
+        y - float labels
+        idx - rows of the iterations
+        t0 - first iteration within the stage
+        eta, r, R, kappa, D, ALPHAt - stage parameters
+        v, Vt, VT - state, stage center and stage average of w, a, b
+        Ap, Am - sums of positive and negative rows
+        tmp, u - scratch arrays of the sizes of v and w
+        state - Tp, Tm, p, alpha
+    '''
+
+    Tp, Tm, pt, alphat = state
+    d = len(v) - 2
+    w = v[:d]
+
+    for k in range(len(idx)):
+        t = t0 + k
+        i = idx[k]
+        start = indptr[rows[i]]
+        stop = indptr[rows[i] + 1]
+
+        # compute inner product
+        prod = 0.0
+        for p in range(start, stop):
+            j = p - start if dense else indices[p]
+            prod += w[j] * data[p]
+        at = v[d]
+        bt = v[d + 1]
+
+        if y[i] == 1:
+            for p in range(start, stop):
+                Ap[p - start if dense else indices[p]] += data[p]
+            Tp += 1
+            pt = Tp / (Tp + Tm)
+
+            # compute gradient
+            gradwt = 2 * (1 - pt) * (prod - at) - 2 * (1 + alphat) * (1 - pt)
+            gradat = 2 * (1 - pt) * (at - prod)
+            gradbt = 0.0
+            gradalphat = -2 * (1 - pt) * prod - 2 * pt * (1 - pt) * alphat
+        else:
+            for p in range(start, stop):
+                Am[p - start if dense else indices[p]] += data[p]
+            Tm += 1
+            pt = Tp / (Tp + Tm)
+
+            # as the NumPy code, negative rows are counted as positive too
+            for p in range(start, stop):
+                Ap[p - start if dense else indices[p]] += data[p]
+            Tp += 1
+            pt = Tp / (Tp + Tm)
+
+            # compute gradient
+            gradwt = 2 * pt * (prod - bt) + 2 * (1 + alphat) * pt
+            gradat = 0.0
+            gradbt = 2 * pt * (bt - prod)
+            gradalphat = 2 * pt * prod - 2 * pt * (1 - pt) * alphat
+
+        # update variable
+        for p in range(start, stop):
+            w[p - start if dense else indices[p]] -= eta * gradwt * data[p]
+        v[d] = at - eta * gradat
+        v[d + 1] = bt - eta * gradbt
+        alphat = alphat + eta * gradalphat
+
+        # projection, twice as proj_primal and proj_dual
+        for _ in range(2):
+            _proj_sim(w, R, u)
+            v[d] = min(max(v[d], -R * kappa), R * kappa)
+            v[d + 1] = min(max(v[d + 1], -R * kappa), R * kappa)
+            _proj_l2(v, Vt, r, tmp)
+        for _ in range(2):
+            alphat = min(max(alphat, -2 * R * kappa), 2 * R * kappa)
+            norm = abs(alphat - ALPHAt)
+            if norm > D:
+                alphat = (alphat - ALPHAt) / norm * D + ALPHAt
+
+        # running average of w, a and b
+        for j in range(d + 2):
+            VT[j] = (VT[j] * t + v[j]) / (t + 1)
+
+    state[:] = (Tp, Tm, pt, alphat)
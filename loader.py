@@ -6,8 +6,10 @@ Author: Zhenhuan(Neyo) Yang
 import os, psutil
 import csv
 import numpy as np
-import pandas as pd
 import h5py
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix, issparse
+from rows import Subset
 
 def usage():
 
@@ -17,64 +19,174 @@ def usage():
 
     return mem
 
-def loader(filename,n = True,f = False,z = False,m = False,s = True):
+def _parse_block(buf):
     '''
-    Data file loader
+    Parse whole libsvm lines in a byte block
     input:
-        filename - filename
+        buf - bytes ending at a line break
     output:
-        x - sample features
-        y - sample labels
+        labels - labels of non blank lines
+        counts - number of features per line
+        indices - feature indices as in the file
+        data - feature values
     '''
-    print('Initializing cvs reader......', end=' ')
-    # raw data
-    L = []
-    with open('/home/neyo/PycharmProjects/AUC/datasets/' + filename, 'r') as file:
-        for line in file:
-            l = line.strip().split(' ')
-            l[0] = '0:' + l[0]
-            l = filter(None, l)  # get rid of potential empty elements
-            L.append(dict(i.split(':') for i in l))
-    print('Done! Memory usage: %f' % (usage()))
 
-    print('Converting to dataframe......', end=' ')
-    df = pd.DataFrame(L, dtype='float32').fillna(0) # use float32 to reduce memory usage
-    print('Done! Memory usage: %f' % (usage()))
+    a = np.frombuffer(buf, dtype=np.uint8)
+    breaks = np.flatnonzero(a == ord('\n'))
+    starts = np.concatenate(([0], breaks + 1))
+    if starts[-1] == len(a):
+        starts = starts[:-1]
+    stops = np.concatenate((breaks, [len(a)]))[:len(starts)]
 
-    print('Converting to array......', end=' ')
-    X = df.iloc[:, 1:].values
-    Y = df.iloc[:, 0].values.astype('int32')
-    print('Done! Memory usage: %f' % (usage()))
+    # skip blank lines, every other line is a label followed by index:value pairs
+    keep = np.ones(len(starts), dtype=bool)
+    for k in np.flatnonzero(np.isin(a[np.minimum(starts, len(a) - 1)], list(b' \t\r\n'))):
+        keep[k] = bool(buf[starts[k]:stops[k]].strip())
+    counts = np.bincount(np.searchsorted(breaks, np.flatnonzero(a == ord(':'))), minlength=len(starts))[keep]
 
-    # centralize
-    if m == True:
-        print('Centralizing......', end=' ')
-        mean = np.mean(X, axis=1)
-        X = (X.transpose() - mean).transpose()
-        print('Done! Memory usage: %f' % (usage()))
+    tokens = np.fromstring(buf.replace(b':', b' ').decode('ascii'), sep=' ')
+    if len(tokens) != np.sum(keep) + 2 * np.sum(counts):
+        raise ValueError('Malformed libsvm block')
 
-    # normalize
-    if n == True:
-        print('Normalizing......', end=' ')
-        norm = np.linalg.norm(X, axis=1)
-        X = X / norm[:, None]
-        print('Done! Memory usage: %f' % (usage()))
+    # labels sit in front of each line's pairs
+    first = np.cumsum(1 + 2 * counts) - (1 + 2 * counts)
+    labels = tokens[first]
+    pairs = np.delete(tokens, first)
 
-    # feature scaling
-    if f == True:
-        print('Scaling......', end=' ')
-        mi = np.min(X,axis=1)
-        ma = np.max(X,axis=1)
-        X = (X - mi[:, None]) / (ma[:, None] - mi[:, None])
-        print('Done! Memory usage: %f' % (usage()))
+    return labels, counts, pairs[0::2].astype(np.int64), pairs[1::2].astype(np.float32)
 
-    # z-sccore
-    if z == True:
-        print('Z-scoring......', end=' ')
-        me = np.mean(X,axis=1)
-        st = np.std(X,axis=1)
-        X = (X - me[:, None]) / st[:,None]
-        print('Done! Memory usage: %f' % (usage()))
+def _parse_range(path, start, stop, block):
+    '''
+    Parse the lines in bytes [start, stop) of a libsvm file, block by block
+    '''
+
+    parts = []
+    rest = b''
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while start < stop:
+            buf = rest + file.read(min(block, stop - start))
+            start += len(buf) - len(rest)
+            end = buf.rfind(b'\n') + 1 if start < stop else len(buf)
+            if end == 0:  # a line longer than the block
+                rest = buf
+                continue
+            parts.append(_parse_block(buf[:end]))
+            rest = buf[end:]
+
+    return [np.concatenate(p) for p in zip(*parts)]
+
+def parse(path, sparse = True, n_features = None, block = 1 << 24, workers = 1):
+    '''
+    Fast libsvm reader building csr arrays directly
+    input:
+        path - libsvm file
+        sparse - return a csr matrix, otherwise a dense array
+        n_features - number of features, default the largest index
+        block - bytes read at once
+        workers - processes parsing separate byte ranges of the file
+    output:
+        X - float32 features
+        y - labels
+    '''
+
+    # cut the file into ranges at line breaks
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, 'rb') as file:
+        for k in range(1, workers):
+            file.seek(max(size * k // workers, cuts[-1]))
+            file.readline()
+            cuts.append(min(file.tell(), size))
+    cuts.append(size)
+    ranges = [(path, lo, hi, block) for lo, hi in zip(cuts[:-1], cuts[1:]) if lo < hi]
+
+    if workers > 1 and len(ranges) > 1:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            parts = list(pool.map(_parse_range, *zip(*ranges)))
+    else:
+        parts = [_parse_range(*r) for r in ranges]
+    labels, counts, indices, data = [np.concatenate(p) for p in zip(*parts)]
+
+    # libsvm indices start from one unless a zero shows up
+    if len(indices) and indices.min() > 0:
+        indices -= 1
+    if n_features is None:
+        n_features = int(indices.max()) + 1 if len(indices) else 0
+
+    indptr = np.zeros(len(labels) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    X = csr_matrix((data.astype(np.float32, copy=False), indices, indptr), shape=(len(labels), n_features))
+    X.sum_duplicates()
+
+    return (X if sparse else X.toarray()), labels
+
+def preprocess(X, n = True, f = False, z = False, m = False, chunk = 65536):
+    '''
+    Row wise preprocessing in place
+    input:
+        X - float32 dense array or csr matrix, overwritten
+        n - normalize rows to unit length
+        f - scale rows to [0, 1]
+        z - z-score rows
+        m - centralize rows
+        chunk - dense rows transformed at once
+    output:
+        X - the same array
+    '''
+
+    if issparse(X):
+        # only normalization keeps zeros at zero
+        if f or z or m:
+            raise ValueError('Only normalization works on sparse features')
+        if n:
+            counts = np.diff(X.indptr)
+            sq = np.bincount(np.repeat(np.arange(X.shape[0]), counts), weights=X.data * X.data, minlength=X.shape[0])
+            X.data /= np.repeat(np.sqrt(sq), counts).astype(X.dtype)
+        return X
+
+    for start in range(0, X.shape[0], chunk):
+        B = X[start:start + chunk]
+
+        # centralize
+        if m:
+            B -= B.mean(axis=1, keepdims=True)
+
+        # normalize
+        if n:
+            B /= np.linalg.norm(B, axis=1, keepdims=True)
+
+        # feature scaling
+        if f:
+            mi = B.min(axis=1, keepdims=True)
+            B -= mi
+            B /= B.max(axis=1, keepdims=True)
+
+        # z-score
+        if z:
+            B -= B.mean(axis=1, keepdims=True)
+            B /= B.std(axis=1, keepdims=True)
+
+    return X
+
+def loader(filename,n = True,f = False,z = False,m = False,s = True,sparse = False):
+    '''
+    Data file loader
+    input:
+        filename - filename
+        sparse - keep features as a csr matrix, only normalization applies then
+    output:
+        x - sample features, a shuffled Subset view when s is True
+        y - sample labels
+    '''
+    print('Parsing libsvm file......', end=' ')
+    X, Y = parse('/home/neyo/PycharmProjects/AUC/datasets/' + filename, sparse=sparse) # float32 to reduce memory usage
+    Y = Y.astype('int32')
+    print('Done! Memory usage: %f' % (usage()))
+
+    print('Preprocessing......', end=' ')
+    preprocess(X, n=n, f=f, z=z, m=m)
+    print('Done! Memory usage: %f' % (usage()))
 
     # convert to +1, -1 binary class
     print('Converting to +1 -1 binary class......', end=' ')
@@ -84,14 +196,14 @@ def loader(filename,n = True,f = False,z = False,m = False,s = True):
     Y[index] = -1
     print('Done! Memory usage: %f' % (usage()))
 
-    # shuffle
-    print('Shuffling......', end=' ')
-    mask = np.arange(Y.shape[0])
+    # shuffle rows through a permutation index rather than a copy
     if s == True:
-        np.random.shuffle(mask)
+        print('Shuffling......', end=' ')
+        mask = np.random.permutation(Y.shape[0])
         print('Done! Memory usage: %f' % (usage()))
+        return Subset(X, mask), Y[mask]
 
-    return X[mask], Y[mask]
+    return X, Y
 
 if __name__ == '__main__':
     #np.random.seed(4)
@@ -99,7 +211,12 @@ if __name__ == '__main__':
     FEATURES,LABELS = loader(dataset)
     print('Write .h5 file......', end=' ')
     hf = h5py.File('/home/neyo/PycharmProjects/AUC/h5-datasets/%s.h5' %(dataset), 'w')
-    hf.create_dataset('FEATURES',data=FEATURES)
+    # row chunks of about 1MB so training can stream them, see source.H5Rows
+    n,d = FEATURES.shape
+    rows = max(1,min(n,2**20//(4*d)))
+    hf.create_dataset('FEATURES',shape=(n,d),dtype='float32',chunks=(rows,d))
+    for start in range(0,n,rows*64): # gather the shuffled rows block by block
+        hf['FEATURES'][start:start+rows*64] = FEATURES[start:start+rows*64]
     hf.create_dataset('LABELS', data=LABELS)
     hf.close()
     print('Done! Memory usage: %f' % (usage()))
\ No newline at end of file
@@ -0,0 +1,127 @@
+'''
+Row access shared by dense and sparse features
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+from scipy.sparse import issparse
+
+class Subset:
+    '''
+    Rows idx of X without copying them
+
+    Single rows are views into X, only blocks asked for explicitly (a mini
+    batch, a chunk of test scores) are gathered.
+    '''
+
+    def __init__(self, X, idx, chunk = 65536):
+        '''
+        input:
+            X - dense array, csr matrix or Subset, whose indices are composed
+            idx - row indices
+            chunk - rows gathered at once for products
+        '''
+
+        if isinstance(X, Subset):
+            X, idx = X.X, X.idx[np.asarray(idx)]
+
+        self.X = check(X)
+        self.idx = np.asarray(idx)
+        self.shape = (len(self.idx), X.shape[1])
+        self.chunk = chunk
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, i):
+        return self.X[self.idx[i]]
+
+    def __matmul__(self, w):
+        return np.concatenate([np.asarray(self.X[self.idx[start:start + self.chunk]] @ w).ravel()
+                               for start in range(0, self.shape[0], self.chunk)])
+
+def check(X):
+    '''
+    Bring features into a form the solvers can index row by row
+    input:
+        X - dense array, scipy sparse matrix or Subset
+    output:
+        X - dense array, canonical csr matrix or Subset
+    '''
+
+    if issparse(X):
+        X = X.tocsr()
+        X.sum_duplicates()  # fancy index updates need unique indices
+
+    return X
+
+def row(X, i):
+    '''
+    Get a row as indices and values
+    input:
+        X - dense array, csr matrix or Subset
+        i - row index
+    output:
+        ind - column indices, a full slice for dense rows
+        val - values
+    '''
+
+    if isinstance(X, Subset):
+        return row(X.X, X.idx[i])
+
+    if issparse(X):
+        start, stop = X.indptr[i], X.indptr[i + 1]
+        return X.indices[start:stop], X.data[start:stop]
+
+    return slice(None), X[i]
+
+def is_sparse(X):
+    '''
+    Whether the rows of X are stored sparse
+    input:
+        X - dense array, csr matrix or Subset
+    '''
+
+    if isinstance(X, Subset):
+        return is_sparse(X.X)
+
+    return issparse(X)
+
+def dense_row(X, i):
+    '''
+    Get a row as a dense vector
+    input:
+        X - dense array, csr matrix or Subset
+        i - row index
+    output:
+        x - dense row
+    '''
+
+    if isinstance(X, Subset):
+        return dense_row(X.X, X.idx[i])
+
+    if issparse(X):
+        x = np.zeros(X.shape[1])
+        ind, val = row(X, i)
+        x[ind] = val
+        return x
+
+    return X[i]
+
+def mean(X, mask, chunk = 65536):
+    '''
+    Mean of selected rows, gathered chunk by chunk
+    input:
+        X - dense array, csr matrix or Subset
+        mask - boolean row mask
+        chunk - rows gathered at once
+    output:
+        m - dense mean vector
+    '''
+
+    idx = np.flatnonzero(mask)
+    m = np.zeros(X.shape[1])
+    for start in range(0, len(idx), chunk):
+        m += np.asarray(X[idx[start:start + chunk]].sum(axis=0)).ravel()
+
+    return m / len(idx)
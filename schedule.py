@@ -0,0 +1,182 @@
+'''
+Evaluation schedule shared by the solvers
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+import time
+from bisect import bisect_right
+from sklearn.metrics import roc_auc_score
+from auc import AUC, SketchAUC
+from stopping import Stopping
+
+class Schedule:
+    '''
+    Decide when to score an iterate on the test set and keep the record
+
+    options:
+        'eval' - 'stride' (default), 'geometric' or 'time'
+        'stride' - evaluate every stride iterations, default 1
+        'rec' - exponent step of the geometric schedule 2 ** (4, 4 + rec, ...), default .5
+        'eval_time' - seconds of training between evaluations, default 1
+        'metric' - 'exact' (default) for auc.AUC, 'sklearn' for roc_auc_score or
+                   'sketch' for auc.SketchAUC with options 'chunk', 'bins', 'eps'
+        'stopping' - callable deciding to stop after an evaluation, default
+                     stopping.Stopping with its options
+        'until' - pause at this iteration, stopped is then 'paused' and the
+                  solver can be resumed from options['checkpoint']
+
+    Elapsed time only counts training, time spent on scoring is excluded.
+    The last iteration is always evaluated. Solvers leave their loop once
+    stopped is set, a non-finite iterate is not scored nor recorded.
+    '''
+
+    def __init__(self, Xte, Yte, options, T, stamp = 10):
+        '''
+        input:
+            Xte - testing features, may be an h5py dataset with the 'sketch' metric
+            Yte - testing labels
+            options - solver options
+            T - total number of iterations
+            stamp - log every stamp evaluations
+        '''
+
+        self.T = T
+        self.until = options.get('until')
+        self.stamp = stamp
+        self.mode = options.get('eval', 'stride')
+
+        if self.mode == 'stride':
+            self.stride = options.get('stride', 1)
+        elif self.mode == 'geometric':
+            res_idx = 2 ** (np.arange(4, np.log2(max(T, 2)), options.get('rec', .5)))
+            self.res_idx = sorted(set(int(i) for i in res_idx) | {T})
+            self.i_res = 0
+        elif self.mode == 'time':
+            self.eval_time = options.get('eval_time', 1)
+            self.next_time = self.eval_time
+        else:
+            print('Wrong evaluation schedule!')
+
+        # score an iterate
+        metric = options.get('metric', 'exact')
+        if metric == 'exact':
+            auc = AUC(Yte)
+            self.score = lambda w: auc(Xte @ w)
+        elif metric == 'sklearn':
+            self.score = lambda w: roc_auc_score(Yte, Xte @ w)
+        elif metric == 'sketch':
+            self.score = SketchAUC(Xte, Yte, chunk=options.get('chunk', 65536), bins=options.get('bins', 1024),
+                                   eps=options.get('eps', 1e-3))
+        else:
+            print('Wrong metric!')
+
+        # record results
+        self.iterations = []
+        self.elapsed_time = []
+        self.roc_auc = []
+
+        # early stopping, the reason once stopped
+        self.stopping = options.get('stopping') or Stopping(options)
+        self.stopped = None
+
+        # last iteration evaluated
+        self.t = 0
+
+        # record time elapsed
+        self.elapsed = 0.0
+        self.start = time.time()
+
+    def due(self, t):
+        '''
+        Whether iteration t should be evaluated
+        '''
+
+        if t == self.T or t == self.until:
+            return True
+        if self.mode == 'stride':
+            return t % self.stride == 0
+        elif self.mode == 'geometric':
+            while self.res_idx[self.i_res] < t:
+                self.i_res += 1
+            return self.res_idx[self.i_res] == t
+        elif self.mode == 'time':
+            return self.elapsed + time.time() - self.start >= self.next_time
+        return False
+
+    def upcoming(self, t, steps = 1024):
+        '''
+        First iteration after t that may be due, compiled loops run up to it in one call
+        input:
+            t - current iteration
+            steps - iterations between clock checks in 'time' mode
+        '''
+
+        if self.mode == 'stride':
+            b = min((t // self.stride + 1) * self.stride, self.T)
+        elif self.mode == 'geometric':
+            b = self.res_idx[bisect_right(self.res_idx, t)]
+        else:
+            b = min(t + steps, self.T)
+
+        if self.until is not None and t < self.until:
+            b = min(b, self.until)
+        return b
+
+    def record(self, t, w):
+        '''
+        Score w, pausing the training clock
+        input:
+            t - iteration
+            w - iterate to score
+        '''
+
+        self.elapsed += time.time() - self.start
+        self.t = t
+        if self.mode == 'time':
+            self.next_time = self.elapsed + self.eval_time
+
+        auc = None
+        if np.all(np.isfinite(w)):
+            auc = self.score(w)
+            self.iterations.append(t)
+            self.elapsed_time.append(self.elapsed)
+            self.roc_auc.append(auc)
+
+            # running log
+            if len(self.roc_auc) % self.stamp == 0:
+                print('iteration: %d AUC: %.6f time elapsed: %.2f' % (t, self.roc_auc[-1], self.elapsed_time[-1]))
+
+        self.stopped = self.stopping(t, w, auc, self.elapsed)
+        if self.stopped is not None:
+            print('stopped at iteration %d: %s' % (t, self.stopped))
+        elif self.until is not None and t >= self.until and t < self.T:
+            self.stopped = 'paused'
+
+        self.start = time.time()
+
+    def state(self):
+        '''
+        Records and counters to resume from, picklable with the stopping rule
+        '''
+
+        return {'t': self.t, 'iterations': self.iterations, 'elapsed_time': self.elapsed_time,
+                'roc_auc': self.roc_auc, 'elapsed': self.elapsed, 'stopping': self.stopping,
+                'stopped': self.stopped, 'next_time': getattr(self, 'next_time', None)}
+
+    def restore(self, state):
+        '''
+        Continue from a state of an earlier run, the training clock restarts now
+        input:
+            state - output of state
+        '''
+
+        self.t = state['t']
+        self.iterations = list(state['iterations'])
+        self.elapsed_time = list(state['elapsed_time'])
+        self.roc_auc = list(state['roc_auc'])
+        self.elapsed = state['elapsed']
+        self.stopping = state['stopping']
+        if self.mode == 'time':
+            self.next_time = state['next_time']
+        self.start = time.time()
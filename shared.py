@@ -0,0 +1,97 @@
+'''
+Share a dataset between worker processes
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from scipy.sparse import csr_matrix, issparse
+from rows import check, Subset
+
+def mapped(a):
+    '''
+    Where a lies in a file mapped read only, as np.load(..., mmap_mode='r') maps it
+    input:
+        a - array
+    output:
+        filename, offset - None if a is not a contiguous view of such a map
+    '''
+
+    m = a
+    while m is not None and not isinstance(m, np.memmap):
+        m = m.base
+    if m is None or m.mode != 'r' or m.filename is None or not a.flags.c_contiguous:
+        return None
+
+    return m.filename, m.offset + a.ctypes.data - m.ctypes.data
+
+def share(X):
+    '''
+    Copy features into shared memory once, features mapped from a file are
+    mapped again by the workers and a Subset only sends its indices
+    input:
+        X - dense array, csr matrix or Subset of them
+    output:
+        blocks - shared memory blocks, close and unlink them when done
+        spec - picklable description for attach
+    '''
+
+    X = check(X)
+    spec = {}
+    if isinstance(X, Subset):
+        spec['idx'] = X.idx
+        X = X.X
+
+    if issparse(X):
+        arrays = {'data': X.data, 'indices': X.indices, 'indptr': X.indptr}
+    else:
+        arrays = {'data': np.ascontiguousarray(X)}
+
+    blocks = []
+    spec.update(shape=X.shape, sparse=issparse(X))
+    for key, a in arrays.items():
+        file = mapped(a)
+        if file is not None:
+            spec[key] = ('file', file, a.shape, a.dtype.str)
+            continue
+        shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        blocks.append(shm)
+        spec[key] = ('shm', shm.name, a.shape, a.dtype.str)
+
+    return blocks, spec
+
+def attach(spec):
+    '''
+    Map shared features into this process without copying
+    input:
+        spec - description from share
+    output:
+        blocks - shared memory blocks, keep them alive while X is used
+        X - dense array, csr matrix or Subset backed by shared memory or the file
+    '''
+
+    blocks = []
+    arrays = {}
+    for key in ['data', 'indices', 'indptr']:
+        if key in spec:
+            kind, name, shape, dtype = spec[key]
+            if kind == 'file':
+                filename, offset = name
+                arrays[key] = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+            else:
+                shm = SharedMemory(name=name)
+                blocks.append(shm)
+                arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    if spec['sparse']:
+        X = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=spec['shape'], copy=False)
+        X.has_sorted_indices = True
+        X.has_canonical_format = True
+    else:
+        X = arrays['data']
+
+    if 'idx' in spec:
+        X = Subset(X, spec['idx'])
+
+    return blocks, X
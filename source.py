@@ -0,0 +1,125 @@
+'''
+Stream training rows from HDF5 files
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+class H5Rows:
+    '''
+    Rows [start, stop) of an HDF5 dataset read chunk by chunk
+
+    The solvers walk their index sequences t % n forward, so the chunk after
+    the current one (wrapping around) is read in a background thread while
+    the current one is used. Only one chunk plus the one being prefetched is
+    held in memory. Reads that miss the current chunk, such as old buffered
+    rows, go to the file directly.
+    '''
+
+    def __init__(self, data, start = 0, stop = None, chunk = None, prefetch = True):
+        '''
+        input:
+            data - h5py dataset of features, e.g. hf['FEATURES']
+            start - first row
+            stop - one past the last row, default all rows
+            chunk - rows per read, default about 32MB aligned to the HDF5 chunks
+            prefetch - read the next chunk in a background thread
+        '''
+
+        self.data = data
+        self.start = start
+        self.stop = data.shape[0] if stop is None else stop
+        self.shape = (self.stop - self.start, data.shape[1])
+
+        if chunk is None:
+            chunk = max(1, (32 << 20) // (data.shape[1] * data.dtype.itemsize))
+            if data.chunks is not None:
+                chunk = max(1, chunk // data.chunks[0]) * data.chunks[0]
+        self.chunk = min(chunk, self.shape[0])
+        self.n_chunks = (self.shape[0] - 1) // self.chunk + 1
+
+        self.current = -1
+        self.rows = None
+        self.executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self.future = None
+        self.next = -1
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read(self, c):
+        '''
+        Read chunk c from the file
+        '''
+
+        lo = self.start + c * self.chunk
+        hi = min(lo + self.chunk, self.stop)
+        return self.data[lo:hi]
+
+    def _load(self, c):
+        '''
+        Make chunk c current and start prefetching the one after it
+        '''
+
+        if self.future is not None and self.next == c:
+            self.rows = self.future.result()
+        else:
+            self.rows = self._read(c)
+        self.current = c
+
+        if self.executor is not None:
+            self.next = (c + 1) % self.n_chunks
+            self.future = self.executor.submit(self._read, self.next)
+
+    def _gather(self, idx):
+        '''
+        Rows idx, read chunk by chunk
+        '''
+
+        idx = np.asarray(idx)
+        out = np.empty((len(idx), self.shape[1]), dtype=self.data.dtype)
+        chunks = idx // self.chunk
+        for c in np.unique(chunks):
+            mask = chunks == c
+            if c != self.current:
+                self._load(c)
+            out[mask] = self.rows[idx[mask] - c * self.chunk]
+        return out
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._gather(np.arange(self.shape[0])[i])
+        if np.ndim(i) > 0:
+            i = np.asarray(i)
+            return self._gather(np.flatnonzero(i) if i.dtype == bool else i)
+
+        c = i // self.chunk
+        if c == self.current:
+            return self.rows[i - c * self.chunk]
+        if self.current == -1 or c == (self.current + 1) % self.n_chunks:
+            # moving forward along the sequence
+            self._load(c)
+            return self.rows[i - c * self.chunk]
+
+        # a stray row elsewhere in the file
+        return self.data[self.start + i]
+
+    def __matmul__(self, w):
+        scores = []
+        future = None
+        for c in range(self.n_chunks):
+            rows = self._read(c) if future is None else future.result()
+            if self.executor is not None and c + 1 < self.n_chunks:
+                future = self.executor.submit(self._read, c + 1)
+            scores.append(rows @ w)
+        return np.concatenate(scores)
+
+    def close(self):
+        '''
+        Stop the prefetching thread
+        '''
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
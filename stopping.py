@@ -0,0 +1,88 @@
+'''
+Early stopping consulted at evaluations
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+from math import isfinite, sqrt
+
+class Stopping:
+    '''
+    Decide at each evaluation whether training should go on
+
+    options:
+        'patience' - stop after this many evaluations without the best AUC
+                     improving by more than 'min_delta', default None (off)
+        'min_delta' - AUC gain that counts as improving, default 0
+        'tol' - stop when ||w - w_prev|| <= tol * ||w_prev|| between two
+                evaluations, default None (off)
+        'budget' - seconds of training, default None (off)
+        'min_iter' - iterations before patience and tol are checked, default 0
+
+    Patience counts evaluations and tol compares consecutive evaluations, so
+    both depend on the schedule. With the default stride of 1 an averaged
+    iterate moves like 1/t and the AUC of neighbouring iterations hardly
+    differs, so they stop runs long before convergence. Pair them with a
+    sparse schedule ('geometric' or a large 'stride') and a warm-up.
+
+    A non-finite iterate or AUC always stops training, as its predictions are
+    useless from then on. Any callable with the signature of __call__ can be
+    passed as options['stopping'] instead.
+    '''
+
+    def __init__(self, options):
+        '''
+        input:
+            options - solver options
+        '''
+
+        self.patience = options.get('patience')
+        self.min_delta = options.get('min_delta', 0)
+        self.tol = options.get('tol')
+        self.budget = options.get('budget')
+        self.min_iter = options.get('min_iter', 0)
+
+        self.best = -np.inf
+        self.wait = 0
+        self.prev = None
+
+    def __call__(self, t, w, auc, elapsed):
+        '''
+        input:
+            t - iteration
+            w - iterate just scored
+            auc - its AUC, None if w was not scored
+            elapsed - seconds of training so far
+        output:
+            reason - why to stop, None to go on
+        '''
+
+        if auc is None or not isfinite(auc):
+            return 'diverged'
+
+        # patience and tol only count after the warm-up
+        warm = t >= self.min_iter
+
+        if self.patience is not None and warm:
+            if auc > self.best + self.min_delta:
+                self.best = auc
+                self.wait = 0
+            else:
+                self.wait += 1
+                if self.wait >= self.patience:
+                    return 'no AUC gain in %d evaluations' % self.patience
+
+        if self.tol is not None and warm:
+            if self.prev is None:
+                self.prev = np.array(w, dtype=float)
+            else:
+                change = self.prev - w
+                norm = sqrt(self.prev @ self.prev)
+                self.prev[:] = w
+                if sqrt(change @ change) <= self.tol * norm:
+                    return 'iterate changed by less than %g' % self.tol
+
+        if self.budget is not None and elapsed >= self.budget:
+            return 'budget of %gs used' % self.budget
+
+        return None
@@ -9,6 +9,7 @@ import SAUC
 import SAUC_test
 import SAUC_prev
 import SAUC_new
+from source import H5Rows
 
 if __name__ == '__main__':
 
@@ -37,29 +38,33 @@ if __name__ == '__main__':
     ALG = ['prev','test','now']
 
     hf = h5py.File('/home/neyo/PycharmProjects/AUC/h5-datasets/%s.h5' % (dataset), 'r')
-    FEATURES = hf['FEATURES'][:]
     LABELS = hf['LABELS'][:]
-    hf.close()
 
-    # Simple prepare training and testing
+    # Simple prepare training and testing, FEATURES are streamed from the file
     n = len(LABELS)
-    testing = [i for i in range(n // 2)]
-    training = [i for i in range(n // 2, n)]
+    Xte = H5Rows(hf['FEATURES'], 0, n // 2)
+    Xtr = H5Rows(hf['FEATURES'], n // 2, n)
+    Yte = LABELS[:n // 2]
+    Ytr = LABELS[n // 2:]
 
     # Prepare results
     res = {}
     for alg in ALG:
         if alg == 'now':
-            res[alg] = SAUC.SAUC(FEATURES[training], LABELS[training], FEATURES[testing], LABELS[testing], options)
+            res[alg] = SAUC.SAUC(Xtr, Xte, Ytr, Yte, options)
         elif alg == 'prev':
-            res[alg] = SAUC_prev.SAUC(FEATURES[training], LABELS[training], FEATURES[testing], LABELS[testing], options)
+            res[alg] = SAUC_prev.SAUC(Xtr, Xte, Ytr, Yte, options)
         elif alg == 'new':
-            res[alg] = SAUC_new.SAUC(FEATURES[training], LABELS[training], FEATURES[testing], LABELS[testing], options)
+            res[alg] = SAUC_new.SAUC(Xtr, Xte, Ytr, Yte, options)
         elif alg == 'test':
-            res[alg] = SAUC_test.SAUC(FEATURES[training], LABELS[training], FEATURES[testing], LABELS[testing], options)
+            res[alg] = SAUC_test.SAUC(Xtr, Xte, Ytr, Yte, options)
         else:
             pass
 
+    Xtr.close()
+    Xte.close()
+    hf.close()
+
 
     # Plot results
     fig = plt.figure()  # create a figure object
@@ -0,0 +1,42 @@
+'''
+Successive halving against the grid search
+'''
+
+import numpy as np
+from itertools import product
+from sklearn.datasets import make_classification
+import cv
+
+C = [10. ** i for i in range(-3, 2)]
+R = [.1, 1., 10.]
+
+def best(ROC_AUC, configs, folders):
+    '''
+    (c, R) of the highest mean folder AUC
+    '''
+
+    score = {k: np.mean([np.nanmax(ROC_AUC[(folder,) + k]) for folder in range(folders)]) for k in configs}
+    return max(score, key=score.get)
+
+def setup(T):
+    X, y = make_classification(1500, 20, n_informative=5, flip_y=.1, random_state=1)
+    cv.X = X / np.linalg.norm(X, axis=1)[:, None]
+    cv.y = (2 * y - 1).astype(float)
+    cv.options = {'T': T, 'stride': 100}
+
+def test_halving_recovers_the_grid_winner():
+    setup(3000)
+    grid = best(cv.cv('SOLAM', 1500, 3, 2, C, R), list(product(C, R)), 3)
+
+    ROC_AUC, budget = cv.halving('SOLAM', 1500, 3, 2, C, R)
+    final = [k for k, until in budget.items() if until == 3000]
+    assert len(final) < len(C) * len(R)
+    assert best(ROC_AUC, final, 3) == grid
+
+def test_halving_drops_nothing_before_min_budget():
+    setup(900)
+    _, budget = cv.halving('SOLAM', 1500, 3, 2, C, R, min_budget=200)
+    assert sorted(set(budget.values())) == [300, 900]
+
+    _, budget = cv.halving('SOLAM', 1500, 3, 2, C, R, min_budget=900)
+    assert set(budget.values()) == {900}
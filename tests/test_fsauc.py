@@ -0,0 +1,90 @@
+'''
+Projections of FSAUC
+'''
+
+import tracemalloc
+import numpy as np
+from FSAUC import proj_l2, proj_dual, proj_sim
+from jit import _proj_l2, _proj_sim
+
+def test_proj_l2_lands_on_the_ball_around_its_centre():
+    rng = np.random.default_rng(0)
+    o = rng.normal(size=12)
+    v = o + 5 * rng.normal(size=12)
+    R = 1.5
+
+    w = proj_l2(v, o, R)
+    assert np.isclose(np.linalg.norm(w - o), R)
+    # the closest point lies on the segment from o to v
+    assert np.allclose((w - o) / R, (v - o) / np.linalg.norm(v - o))
+
+    # in place, and compiled, give the same point
+    u = v.copy()
+    proj_l2(u, o, R, np.zeros(12))
+    assert np.allclose(u, w)
+    u = v.copy()
+    _proj_l2(u, o, R, np.zeros(12))
+    assert np.allclose(u, w)
+
+def test_proj_l2_keeps_points_inside():
+    o = np.ones(4)
+    v = o + .1
+    assert np.array_equal(proj_l2(v, o, 1.0), v)
+    u = v.copy()
+    proj_l2(u, o, 1.0, np.zeros(4))
+    assert np.array_equal(u, v)
+
+def test_proj_dual_stays_within_D_of_its_centre():
+    # R * kappa large enough that the clip leaves alpha alone
+    alpha = proj_dual(10.0, 3.0, 2.0, 100, 1)
+    assert np.isclose(alpha, 5.0)
+
+def proj_sort(v, R):
+    '''
+    l1 ball projection by sorting, the reference
+    '''
+
+    u = np.sort(np.abs(v))[::-1]
+    sv = np.cumsum(u)
+    rho = np.nonzero(u * np.arange(1, len(v) + 1) > (sv - R))[0][-1]
+    theta = (sv[rho] - R) / (rho + 1)
+    return np.sign(v) * np.maximum(np.abs(v) - theta, 0)
+
+def test_proj_sim_in_place_without_allocating():
+    rng = np.random.default_rng(1)
+    d = 100000
+    v = rng.normal(size=d)
+    R = np.abs(v).sum() / 10
+    w = proj_sort(v, R)
+
+    tmp = np.empty(d)
+    mask = np.empty(d, dtype=bool)
+    u = v.copy()
+    tracemalloc.start()
+    proj_sim(u, R, out=u, tmp=tmp, mask=mask)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < d
+    assert np.allclose(u, w)
+
+    # compiled, with |w| filtered in its scratch
+    u = v.copy()
+    _proj_sim(u, R, np.empty(d))
+    assert np.allclose(u, w)
+
+def test_proj_sim_returns_non_finite_input():
+    v = np.array([1.0, np.nan, -2.0])
+    assert np.isnan(proj_sim(v, 1.0)).any()
+    u = v.copy()
+    _proj_sim(u, 1.0, np.empty(3))
+    assert np.isnan(u).any()
+
+def test_proj_sim_matches_sorting_across_radii():
+    rng = np.random.default_rng(2)
+    v = rng.standard_cauchy(size=2000)
+    for R in np.abs(v).sum() * np.array([1e-6, 1e-3, .1, .5, .99]):
+        w = proj_sort(v, R)
+        assert np.allclose(proj_sim(v, R), w)
+        u = v.copy()
+        _proj_sim(u, R, np.empty(len(v)))
+        assert np.allclose(u, w)
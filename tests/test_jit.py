@@ -0,0 +1,48 @@
+'''
+Compiled backend on Subset rows
+'''
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.datasets import make_classification
+
+pytest.importorskip('numba')
+
+import jit
+from rows import Subset
+from SAUC import SAUC
+from SOLAM import SOLAM
+from SPAM import SPAM
+from FSAUC import FSAUC
+
+SOLVERS = [(SAUC, {'name': 'hinge', 'N': 5, 'c': 10, 'R': .1, 'T': 30, 'stride': 10}),
+           (SOLAM, {'T': 600, 'stride': 200}),
+           (SPAM, {'T': 600, 'stride': 200}),
+           (FSAUC, {'delta': .1, 'T': 600, 'stride': 200})]
+
+def data(sparse):
+    X, y = make_classification(400, 20, random_state=3)
+    X = X / np.linalg.norm(X, axis=1)[:, None]
+    X[np.abs(X) < .1] = 0
+    return (csr_matrix(X) if sparse else X), 2 * y - 1
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('solver, extra', SOLVERS)
+def test_subset_runs_compiled(solver, extra, sparse):
+    X, y = data(sparse)
+    order = np.random.default_rng(0).permutation(len(y))
+    training, testing = order[:300], order[300:]
+    Xtr = Subset(X, training)
+    Xte = Subset(X, testing)
+
+    options = dict({'c': 1, 'R': 1}, **extra)
+    assert jit.backend(dict(options, backend='numba'), Xtr) == 'numba'
+
+    # the compiled run on the view matches NumPy on the view and on the gathered rows
+    _, auc = solver(Xtr, Xte, y[training], y[testing], dict(options, backend='numpy'), stamp=options['T'])
+    _, aucc = solver(Xtr, Xte, y[training], y[testing], dict(options, backend='numba'), stamp=options['T'])
+    _, aucg = solver(X[training], X[testing], y[training], y[testing], dict(options, backend='numba'),
+                     stamp=options['T'])
+    assert np.allclose(auc, aucc, rtol=0, atol=1e-9)
+    assert np.allclose(aucg, aucc, rtol=0, atol=1e-9)
@@ -0,0 +1,70 @@
+'''
+The compiled backend follows the NumPy one
+'''
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from sklearn.datasets import make_classification
+
+pytest.importorskip('numba')
+
+import jit
+from SAUC import SAUC
+from SOLAM import SOLAM
+from SPAM import SPAM
+from FSAUC import FSAUC
+
+# solvers with a compiled kernel, their extra options and how many iterations to run
+SOLVERS = [('SAUC', SAUC, {'name': 'hinge', 'N': 5, 'c': 10, 'R': .1}, .01),
+           ('SOLAM', SOLAM, {}, 1),
+           ('SPAM', SPAM, {}, 1),
+           ('FSAUC', FSAUC, {'delta': .1}, 1)]
+
+def iterate(name, checkpoint):
+    '''
+    Final iterate and its output average from the state of a run
+    '''
+
+    if name == 'SAUC':
+        return np.concatenate([checkpoint['WT'], checkpoint['avgwt']])
+    if name == 'FSAUC':
+        return np.concatenate([checkpoint['v'], checkpoint['VT']])
+    return np.concatenate([checkpoint['wt'].toarray(), checkpoint['avg'].mean()])
+
+def run(name, solver, X, y, options):
+    '''
+    Records and final iterates of a run on a 5 / 1 split of X
+    '''
+
+    m = X.shape[0] * 5 // 6
+    options = dict(options, checkpoint={})
+    _, roc_auc = solver(X[:m], X[m:], y[:m], y[m:], options, stamp=options['T'])
+    return np.array(roc_auc), iterate(name, options['checkpoint'])
+
+@pytest.fixture(scope='module')
+def data():
+    X, y = make_classification(3000, 50, random_state=7)
+    X = X / np.linalg.norm(X, axis=1)[:, None]
+
+    # dense rows and sparse rows take different paths through the kernels
+    X[np.abs(X) < .1] = 0
+    return X, 2 * y - 1
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('name, solver, extra, scale', SOLVERS)
+def test_backends_agree(data, name, solver, extra, scale, sparse, T = 5000, stride = 500, rtol = 1e-9):
+    X, y = data
+    if sparse:
+        X = csr_matrix(X)
+    options = dict({'T': max(1, int(T * scale)), 'c': 1, 'R': 1, 'stride': max(1, int(stride * scale))}, **extra)
+
+    # otherwise NumPy would be compared with itself
+    assert jit.backend(dict(options, backend='numba'), X) == 'numba'
+
+    auc, w = run(name, solver, X, y, dict(options, backend='numpy'))
+    aucc, wc = run(name, solver, X, y, dict(options, backend='numba'))
+
+    assert auc.shape == aucc.shape
+    assert np.abs(w - wc).max() <= rtol * max(np.abs(w).max(), np.finfo(float).tiny)
+    assert np.abs(auc - aucc).max() <= rtol
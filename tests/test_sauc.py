@@ -0,0 +1,56 @@
+'''
+Bernstein negative functions of SAUC
+'''
+
+import numpy as np
+import pytest
+from fractions import Fraction
+from math import comb as binomial
+from SAUC import bern_coef, bern_loss_func, neg
+
+def reference(name, N, L, prod):
+    '''
+    Negative functions and gradients in exact arithmetic from the monomial expansion
+    '''
+
+    L = Fraction(L)
+    loss = bern_loss_func(name, L)
+    f = [Fraction(loss(Fraction(j, N))) for j in range(N + 1)]
+    delta = []
+    for k in range(N + 1):
+        delta.append(f[0])
+        f = [b - a for a, b in zip(f[:-1], f[1:])]
+
+    minus = L / 2 - Fraction(prod)
+    fnt = [(N + 1) * sum(binomial(N, k) * binomial(k, i) * delta[k] / (2 * L) ** k * minus ** (k - i)
+                         for k in range(i, N + 1)) for i in range(N + 1)]
+    gfnt = [(i + 1) * fnt[i + 1] for i in range(N)] + [Fraction(0)]
+    return np.array([float(v) for v in fnt]), np.array([float(v) for v in gfnt])
+
+@pytest.mark.parametrize('name, N, R', [('hinge', 5, 1), ('hinge', 100, 1), ('hinge', 200, .5), ('sign', 60, 1)])
+def test_neg_is_accurate_for_large_degrees(name, N, R):
+    L = 2 * R
+    beta, gbeta, _, _, gamma = bern_coef(name, N, L)
+    assert np.isfinite(gamma)
+
+    for prod in [-R, -.3 * R, 0.0, .7 * R, R]:
+        fnt, gfnt = neg(N, prod, L, beta, gbeta)
+        fnt_, gfnt_ = reference(name, N, L, prod)
+
+        # a few roundings of the terms, which the monomial expansion lost by many digits
+        fscale, gscale = neg(N, prod, L, np.abs(beta), np.abs(gbeta))
+        assert np.all(np.abs(fnt - fnt_) <= 1e-12 * fscale + 1e-300)
+        assert np.all(np.abs(gfnt - gfnt_) <= 1e-12 * gscale + 1e-300)
+        assert np.abs(fnt - fnt_).max() <= 1e-6 * np.abs(fnt_).max()
+
+def test_neg_batches_agree_with_single_products():
+    beta, gbeta, _, _, _ = bern_coef('logistic', 20, 2)
+    prod = np.linspace(-1, 1, 7)
+    fnt, gfnt = neg(20, prod, 2, beta, gbeta)
+    for k, p in enumerate(prod):
+        f, g = neg(20, p, 2, beta, gbeta)
+        assert np.allclose(fnt[k], f) and np.allclose(gfnt[k], g)
+
+def test_bern_coef_refuses_overflowing_degrees():
+    with pytest.raises(ValueError):
+        bern_coef('hinge', 200, 10)
@@ -0,0 +1,243 @@
+'''
+Lazily scaled weight vector
+Author: Zhenhuan(Neyo) Yang
+'''
+
+import numpy as np
+from math import sqrt, fabs
+
+class ScaledVector:
+    '''
+    Weight vector stored as w = scale * v + offset * u
+
+    Shrinkage towards the anchor u and projection onto an l2 ball only touch
+    the scalars, and adding a sparse row only writes its nonzeros. The squared
+    norm of w is kept up to date from the cached v @ v and v @ u, and so are
+    products with tracked fixed vectors such as class means.
+    '''
+
+    def __init__(self, w, u = None):
+        '''
+        input:
+            w - initial vector, copied
+            u - fixed anchor vector, None for no anchor
+        '''
+
+        self.v = np.array(w, dtype=float)
+        self.u = u
+        self.scale = 1.0
+        self.offset = 0.0
+
+        self.vv = float(self.v @ self.v)
+        if u is None:
+            self.uu = 0.0
+            self.vu = 0.0
+        else:
+            self.uu = float(u @ u)
+            self.vu = float(self.v @ u)
+
+        # fixed vectors m with cached v @ m and u @ m
+        self.tracked = []
+
+        # running averages to notify before entries of v change
+        self.averages = []
+
+    def dot(self, ind, val):
+        '''
+        Inner product with a row given as indices and values
+        '''
+
+        prod = self.scale * float(self.v[ind] @ val)
+        if self.offset != 0.0:
+            prod += self.offset * float(self.u[ind] @ val)
+        return prod
+
+    def matvec(self, X):
+        '''
+        Products with all rows of X
+        '''
+
+        prod = self.scale * (X @ self.v)
+        if self.offset != 0.0:
+            prod += self.offset * (X @ self.u)
+        return prod
+
+    def add(self, ind, val):
+        '''
+        w[ind] += val
+        '''
+
+        dv = val / self.scale
+        old = self.v[ind]
+        self.vv += float(2 * (old @ dv) + dv @ dv)
+        if self.u is not None:
+            self.vu += float(dv @ self.u[ind])
+        for entry in self.tracked:
+            entry[1] += float(dv @ entry[0][ind])
+        for avg in self.averages:
+            avg.touch(ind)
+        self.v[ind] = old + dv
+
+    def add_row(self, ind, val, c, prod, sq, mx = ()):
+        '''
+        w[ind] += c * val for a row whose products are known, O(nnz)
+        input:
+            ind, val - row as indices and values
+            c - coefficient
+            prod - w[ind] @ val before the update
+            sq - val @ val
+            mx - m[ind] @ val for each tracked vector m
+        '''
+
+        if self.offset != 0.0:
+            self.add(ind, c * val)
+            return
+
+        a = c / self.scale
+        self.vv += 2 * a * prod / self.scale + a * a * sq
+        for entry, m in zip(self.tracked, mx):
+            entry[1] += a * m
+        for avg in self.averages:
+            avg.touch(ind)
+        self.v[ind] += a * val
+
+    def track(self, m):
+        '''
+        Keep w @ m up to date for a fixed vector m, returns a key for tracked_dot
+        '''
+
+        um = 0.0 if self.u is None else float(self.u @ m)
+        self.tracked.append([m, float(self.v @ m), um])
+        return len(self.tracked) - 1
+
+    def tracked_dot(self, k):
+        '''
+        w @ m for the k-th tracked vector, O(1)
+        '''
+
+        m, vm, um = self.tracked[k]
+        return self.scale * vm + self.offset * um
+
+    def mix(self, a, b):
+        '''
+        w = a * w + b * u
+        '''
+
+        self.scale *= a
+        self.offset = a * self.offset + b
+        self._rescale()
+
+    def sqnorm(self):
+        '''
+        Squared l2 norm of w
+        '''
+
+        s, o = self.scale, self.offset
+        return max(s * s * self.vv + 2 * s * o * self.vu + o * o * self.uu, 0.0)
+
+    def proj(self, R):
+        '''
+        Projection onto the l2 ball of radius R, returns the factor applied
+        '''
+
+        norm = sqrt(self.sqnorm())
+        if norm > R:
+            self.scale *= R / norm
+            self.offset *= R / norm
+            self._rescale()
+            return R / norm
+        return 1.0
+
+    def toarray(self):
+        '''
+        Dense copy of w
+        '''
+
+        w = self.scale * self.v
+        if self.offset != 0.0:
+            w += self.offset * self.u
+        return w
+
+    def _rescale(self):
+        '''
+        Fold a tiny scale back into v before it underflows
+        '''
+
+        if fabs(self.scale) < 1e-8:
+            for avg in self.averages:
+                avg.flush()
+            self.v *= self.scale
+            self.scale = 1.0
+            self.vv = float(self.v @ self.v)
+            if self.u is not None:
+                self.vu = float(self.v @ self.u)
+            for entry in self.tracked:
+                entry[1] = float(self.v @ entry[0])
+
+class Average:
+    '''
+    Weighted running average sum_s c_s w_s / sum_s c_s of a ScaledVector w
+
+    An entry of v is only caught up when w is about to write it or when the
+    average is read, so a step costs O(1) on top of the nonzeros w writes.
+    S = sum_s c_s scale_s runs like a clock, stamp[j] is its value when v[j]
+    was last caught up and v[j] * (S - stamp[j]) is what v[j] owes since.
+    The anchor u of w is fixed, its part only needs sum_s c_s offset_s.
+    '''
+
+    def __init__(self, w):
+        '''
+        input:
+            w - ScaledVector to average, notifies the average of its writes
+        '''
+
+        self.w = w
+        self.sum = np.zeros(len(w.v))
+        self.stamp = np.zeros(len(w.v))
+        self.S = 0.0
+        self.O = 0.0
+        self.weight = 0.0
+        w.averages.append(self)
+
+    def step(self, c = 1.0):
+        '''
+        Add the current w with weight c, O(1)
+        '''
+
+        self.S += c * self.w.scale
+        self.O += c * self.w.offset
+        self.weight += c
+
+    def touch(self, ind):
+        '''
+        Catch up entries ind of the sum before w writes them
+        '''
+
+        self.sum[ind] += self.w.v[ind] * (self.S - self.stamp[ind])
+        self.stamp[ind] = self.S
+
+    def flush(self):
+        '''
+        Catch up every entry and restart the clock, before w rescales v, O(d)
+        '''
+
+        self.sum += self.w.v * (self.S - self.stamp)
+        self.stamp[:] = 0.0
+        self.S = 0.0
+
+    def mean(self, out = None):
+        '''
+        Dense average, O(d)
+        input:
+            out - array for the result
+        output:
+            avg - average of w so far
+        '''
+
+        avg = np.subtract(self.S, self.stamp, out=out)
+        avg *= self.w.v
+        avg += self.sum
+        if self.O != 0.0:
+            avg += self.O * self.w.u
+        avg /= self.weight
+        return avg